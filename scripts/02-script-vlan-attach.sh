@@ -21,8 +21,11 @@ ENABLE_VLAN_EW_FIREWALL="$(echo "${ENABLE_VLAN_EW_FIREWALL:-false}" | tr '[:uppe
 VLAN_INTERFACE_NAME="${VLAN_INTERFACE_NAME:-eth1}"     # override if needed, default eth1
 
 # === Function to Log Events ===
+# Logs go to stderr: several helpers (get_config_view, get_vlan_interface_name)
+# are called inside $(...) captures, and anything they print to stdout would be
+# swallowed into the captured value and corrupt the JSON/interface name.
 log() {
-    echo "[INFO] $(date '+%Y-%m-%d %H:%M:%S') $1"
+    echo "[INFO] $(date '+%Y-%m-%d %H:%M:%S') $1" >&2
 }
 
 log "🔄 Starting VLAN + VPC Attachment Script..."
@@ -36,6 +39,43 @@ function wait_for_dns() {
     log "✅ DNS resolution successful."
 }
 
+# === Direct Linode API access for read-only calls ===
+# Every `linode-cli` invocation forks a full Python interpreter and re-reads the
+# CLI config, which adds seconds of latency when the script polls config state.
+# Read-only lookups go straight to the HTTP API with curl instead; mutations
+# (config-update, reboot, firewalls) stay on the CLI.
+LINODE_CLI_CONFIG="${LINODE_CLI_CONFIG:-/root/.linode-cli/linode-cli}"
+LINODE_TOKEN="${LINODE_TOKEN:-$(awk -F' *= *' '/^token/ {print $2; exit}' "$LINODE_CLI_CONFIG" 2>/dev/null)}"
+
+linode_api_get() {
+    local API_PATH=$1
+    wait_for_dns
+    curl -s -H "Authorization: Bearer $LINODE_TOKEN" "https://api.linode.com/v4$API_PATH"
+}
+
+# The boot config rarely changes while we are looking at it, so fetch it once
+# and reuse the JSON. Call refresh_config_view after any config-update.
+CONFIG_VIEW_CACHE=""
+
+# Populates the cache in the CALLER's shell. This must run outside any $(...)
+# capture: an assignment made inside a command substitution dies with its
+# subshell, so callers invoke ensure_config_view first and then pipe
+# get_config_view, which only echoes the already-cached JSON.
+ensure_config_view() {
+    if [[ -z "$CONFIG_VIEW_CACHE" ]]; then
+        CONFIG_VIEW_CACHE=$(linode_api_get "/linode/instances/$LINODE_ID/configs/$CONFIG_ID")
+    fi
+}
+
+get_config_view() {
+    ensure_config_view
+    echo "$CONFIG_VIEW_CACHE"
+}
+
+refresh_config_view() {
+    CONFIG_VIEW_CACHE=""
+}
+
 # 🧼 Cleanup old CoreDNS reboot lock if held by this node
 REBOOT_LOCK_KEY="/coredns-reboot-lock"
 CURRENT_NODE=$(hostname)
@@ -56,8 +96,8 @@ fi
 
 # === Function to check if VLAN is already attached (interfaces[1]) ===
 is_vlan_attached() {
-    wait_for_dns ⏳ Ensure DNS is up before calling Linode API
-    VLAN_STATUS=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json | jq -r '.[0].interfaces[1].purpose // empty')
+    ensure_config_view
+    VLAN_STATUS=$(get_config_view | jq -r '.interfaces[1].purpose // empty')
     if [ "$VLAN_STATUS" == "vlan" ]; then
         return 0
     else
@@ -68,13 +108,11 @@ is_vlan_attached() {
 # === Function to check if VPC is already attached (interfaces[VPC_INTERFACE_INDEX]) ===
 is_vpc_attached() {
     # Do NOT depend on ENABLE_VPC_INTERFACE here; just read actual config
-    wait_for_dns ⏳ Ensure DNS is up before calling Linode API
-
     local idx="${VPC_INTERFACE_INDEX:-2}"
     local PURPOSE
 
-    PURPOSE=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json \
-        | jq -r ".[0].interfaces[$idx].purpose // empty")
+    ensure_config_view
+    PURPOSE=$(get_config_view | jq -r ".interfaces[$idx].purpose // empty")
 
     if [[ "$PURPOSE" == "vpc" ]]; then
         return 0
@@ -196,17 +234,15 @@ EOF
 
 # === Function: Detect Configured-But-Missing VLAN Interface and Trigger Reboot ===
 function handle_vlan_configured_but_missing_interface() {
+    ensure_config_view
     set +e
-    wait_for_dns
-    VLAN_ATTACHED=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json | jq -r '.[0].interfaces[1].purpose // empty')
+    VLAN_ATTACHED=$(get_config_view | jq -r '.interfaces[1].purpose // empty')
     set -e
 
     if [[ "$VLAN_ATTACHED" == "vlan" ]]; then
         set +e
-        wait_for_dns
-        VLAN_IP=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json | jq -r '.[0].interfaces[1].ipam_address // empty')
+        VLAN_IP=$(get_config_view | jq -r '.interfaces[1].ipam_address // empty')
         set -e
-        wait_for_dns
         VLAN_INTERFACE=$(ip -o addr show | grep "$VLAN_IP" | awk '{print $2}' | head -n1)
 
         if [[ -z "$VLAN_INTERFACE" ]]; then
@@ -322,10 +358,9 @@ get_vlan_interface_name() {
         return 0
     fi
 
-    wait_for_dns ⏳ Ensure DNS is up before calling Linode API
     local VLAN_IP
-    VLAN_IP=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json \
-        | jq -r '.[0].interfaces[1].ipam_address // empty')
+    ensure_config_view
+    VLAN_IP=$(get_config_view | jq -r '.interfaces[1].ipam_address // empty')
 
     if [[ -z "$VLAN_IP" ]]; then
         log "❌ Could not read VLAN ipam_address from config. Falling back to eth1."
@@ -397,7 +432,8 @@ attach_vpc_interface_only() {
     wait_for_dns ⏳ Ensure DNS is up before calling Linode API
 
     local CONFIG_JSON
-    CONFIG_JSON=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json | jq '.[0]')
+    ensure_config_view
+    CONFIG_JSON=$(get_config_view)
 
     local UPDATED_INTERFACES
     UPDATED_INTERFACES=$(echo "$CONFIG_JSON" | jq --argjson subnet_id "$VPC_SUBNET_ID" '
@@ -406,6 +442,7 @@ attach_vpc_interface_only() {
 
     wait_for_dns ⏳ Ensure DNS is up before calling Linode API
     linode-cli linodes config-update "$LINODE_ID" "$CONFIG_ID" --interfaces "$UPDATED_INTERFACES"
+    refresh_config_view
 
     log "✅ VPC interface successfully attached as eth${VPC_INTERFACE_INDEX}."
 }
@@ -461,8 +498,8 @@ push_route() {
 
                 log "Checking the VLAN_INTERFACE..."
                 # Extract the VLAN IP
-                wait_for_dns ⏳ Ensure DNS is up before calling Linode API
-                VLAN_IP=$(linode-cli linodes config-view "$LINODE_ID" "$CONFIG_ID" --json | jq -r '.[0].interfaces[1].ipam_address // empty')
+                ensure_config_view
+                VLAN_IP=$(get_config_view | jq -r '.interfaces[1].ipam_address // empty')
 
                 # Extract the IP portion (strip subnet)
                 VLAN_IP_ADDR=$(echo "$VLAN_IP" | cut -d'/' -f1)
@@ -810,6 +847,7 @@ echo "$INTERFACES_JSON" | jq .
 log "⚙️  Attaching VLAN (and optional VPC) interface(s) to Linode instance..."
 wait_for_dns # ⏳ Ensure DNS is up before calling Linode API
 linode-cli linodes config-update "$LINODE_ID" "$CONFIG_ID" --interfaces "$INTERFACES_JSON" --label "Boot Config"
+refresh_config_view
 
 # === Check VLAN is attached after attachment and then reboot ONCE ===
 if is_vlan_attached; then
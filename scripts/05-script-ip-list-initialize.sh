@@ -282,13 +282,23 @@ fi
 
 export ETCDCTL_API=3
 
+# Create-only transaction per key: the put only fires when the key does not
+# exist yet, so we never overwrite allocation metadata already written by the
+# REST API (the old unconditional put clobbered it).
 while IFS= read -r ip; do
     key="/vlan/ip/$ip"
-    output=$(etcdctl --endpoints="$ETCD_ENDPOINTS" put --prev-kv "$key" "true" 2>&1)
-    if [[ "$output" == *"prev_kv"* ]]; then
-        log "🔁 IP $ip already exists in etcd, skipping."
-    else
+    output=$(etcdctl --endpoints="$ETCD_ENDPOINTS" txn 2>&1 <<EOF
+create("$key") = "0"
+
+put $key true
+
+
+EOF
+)
+    if [[ "$output" == SUCCESS* ]]; then
         log "✅ IP $ip synced to etcd."
+    else
+        log "🔁 IP $ip already exists in etcd, skipping."
     fi
 done < "$OUTPUT_FILE"
 
@@ -39,40 +39,157 @@
 #
 # ======================================================================================
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 import os
 import ipaddress
 import sys
 import time
 import requests
+from requests.adapters import HTTPAdapter
 import random
 import signal
 import configparser
+import copy
+import json
 import yaml
 import uuid
+import queue
+import threading
+import functools
+from socket import inet_aton, inet_ntoa
 import psutil
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+import logging
+from logging.handlers import RotatingFileHandler
 from datetime import datetime
-from filelock import FileLock
 
 import etcd3
+import etcd3.etcdrpc as etcdrpc
+from etcd3.utils import prefix_range_end, to_bytes
 from kubernetes import client, config
+from kubernetes.client.rest import ApiException
+
+# orjson (C-implemented) encodes large string arrays several times faster than
+# stdlib json; used for the /api/v1/vlan-ips listing, where a big pool means
+# tens of thousands of IP strings per response. Optional: stdlib jsonify is
+# the fallback so a leaner image still works.
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on image contents
+    orjson = None
 
 app = Flask(__name__)
 CORS(app)
 
+# Route ALL jsonify() calls through orjson when both it and Flask's pluggable
+# JSON provider API (Flask >= 2.2) are present. Endpoints keep using plain
+# jsonify; only the encoder underneath changes. Falls back silently to the
+# stdlib encoder otherwise.
+if orjson is not None:
+    try:
+        from flask.json.provider import JSONProvider
+
+        class _OrJSONProvider(JSONProvider):
+            def dumps(self, obj, **kwargs):
+                return orjson.dumps(obj).decode("utf-8")
+
+            def loads(self, s, **kwargs):
+                return orjson.loads(s)
+
+        app.json = _OrJSONProvider(app)
+    except ImportError:  # pragma: no cover - older Flask without providers
+        pass
+
+# One pooled HTTP session for all Linode API traffic. Re-creating a connection
+# per call paid a fresh TCP + TLS handshake against api.linode.com every time;
+# the session keeps connections alive and reuses them across requests/threads.
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=10, pool_maxsize=50))
+
 LOG_FILE = "/tmp/allocate-ip.log"
-MAX_LOG_LINES = 1000
+MAX_LOG_BYTES = 256_000
+LOG_BACKUP_COUNT = 3
 MAX_BACKOFF = 60
 
 VLAN_IP_CACHE = {
     "ips": None,
     "timestamp": None,
-    "ttl_seconds": int(os.getenv("CACHE_TTL_SECONDS", 0)),
+    "ttl_seconds": int(os.getenv("CACHE_TTL_SECONDS", 30)),
+    # Refreshed with the data: a small random extension of the TTL so the
+    # three replicas do not all expire (and re-crawl Linode) in lock-step.
+    "ttl_jitter": 0.0,
 }
 
+# Single-flight guard for the cold-cache path: exactly one thread performs
+# the Linode fleet crawl while the rest wait and reuse its result.
+_VLAN_FETCH_LOCK = threading.Lock()
+
+# Single-slot queue feeding the background Linode sync worker. maxsize=1 makes
+# overlapping refresh requests coalesce: if a sync is already pending, there is
+# nothing to enqueue. Set CACHE_TTL_SECONDS=0 to force fully synchronous
+# fetches (the old behavior).
+LINODE_SYNC_QUEUE = queue.Queue(maxsize=1)
+
+# Lazily-refreshed result of validating REGION against the Linode API. There is
+# deliberately no background poller here: the check runs on demand (from
+# /health) and is only repeated once the TTL lapses, so an idle service makes
+# no region lookups at all.
 REGION_CACHE = {"valid": False, "timestamp": None, "ttl_seconds": 3600}
 
+# In-memory view of the /vlan/ip/ keyspace so /allocate does not rescan the
+# whole etcd prefix on every request. The set is refreshed when the TTL lapses
+# and patched incrementally on successful allocate/release/sync operations.
+# Staleness is safe here: the set is only a prefilter, and the etcd
+# compare-and-put transaction remains the authority on whether an IP is free.
+ETCD_USED_CACHE = {
+    "ips": set(),
+    "timestamp": None,
+    "ttl_seconds": int(os.getenv("ETCD_USED_CACHE_TTL_SECONDS", 10)),
+}
+
+# Per-subnet scan cursor: the int address just past the last IP we handed out.
+# Each /allocate resumes scanning from here instead of from the bottom of the
+# subnet, so allocating the k-th IP no longer costs O(k). The scan wraps around
+# to the start of the range, so holes left by released IPs are still found.
+SUBNET_CURSOR = {}
+
+# Keys per multi-op etcd transaction. Each synced key costs one compare plus
+# one put, so 64 keys keeps a txn inside etcd's default --max-txn-ops of 128.
+_SYNC_TXN_CHUNK = 64
+
+# One lock per subnet so concurrent /allocate threads working on DIFFERENT
+# subnets never serialize on each other. Threads on the SAME subnet do
+# serialize through its lock, which means they pick distinct candidates via
+# the shared cursor instead of racing to etcd with the same IP and burning a
+# compare-and-put round trip each. Cross-process races are still resolved by
+# the etcd transaction itself.
+_SUBNET_LOCKS = {}
+_SUBNET_LOCKS_GUARD = threading.Lock()
+
+
+def _subnet_lock(subnet_key):
+    with _SUBNET_LOCKS_GUARD:
+        lock = _SUBNET_LOCKS.get(subnet_key)
+        if lock is None:
+            lock = _SUBNET_LOCKS[subnet_key] = threading.Lock()
+    return lock
+
+
+# Deployment-static configuration, resolved once at import. These values come
+# from the pod spec / ConfigMap and cannot change within a process lifetime,
+# so re-reading the environment inside every request handler buys nothing.
+REGION = os.getenv("REGION")
+NAMESPACE = os.getenv("NAMESPACE", "kube-system")
+ETCD_PREFIX = os.getenv("ETCD_PREFIX", "/vlan/ip/")
+
+# Static pieces of the Linode instance-list request, built once rather than
+# re-serialized inside the crawl loops. json.dumps (not an f-string) so a
+# REGION containing quotes can never produce a malformed filter.
+X_FILTER_REGION = json.dumps({"region": REGION})
+LINODE_INSTANCES_URL = "https://api.linode.com/v4/linode/instances?page_size=500&page="
+
 
 def graceful_exit(signalnum, frame):
     log(f"[INFO] Received signal {signalnum}. Shutting down gracefully...")
@@ -95,7 +212,6 @@ signal.signal(signal.SIGINT, graceful_exit)
 # --------------------------------------------------------------------------------------
 
 def validate_environment():
-    REGION = os.getenv("REGION")
     if not REGION:
         log("[ERROR] REGION environment variable not set.")
         sys.exit(1)
@@ -110,29 +226,36 @@ def validate_environment():
 # ------------
 # Simple logging helper:
 # - Prints to stdout (so logs are visible via systemd/docker/k8s logs)
-# - Also writes to a local file with a lock, keeping only the last MAX_LOG_LINES lines.
+# - Also appends to a local file via RotatingFileHandler, which rotates the file
+#   once it exceeds MAX_LOG_BYTES (keeping LOG_BACKUP_COUNT old files).
 #
-# File locking is used because Flask can run with multiple worker processes/threads, and
-# without a lock the log file could become corrupted (interleaved writes).
+# The previous implementation re-read and rewrote the entire log file under a
+# FileLock on every message, which made each log line O(file size). Appending
+# through the stdlib handler is O(1) per message and the handler serializes
+# writers within the process itself.
 # --------------------------------------------------------------------------------------
 
+_file_logger = logging.getLogger("vlan-ip-controller")
+_file_logger.setLevel(logging.INFO)
+_file_logger.propagate = False
+try:
+    _log_handler = RotatingFileHandler(LOG_FILE, maxBytes=MAX_LOG_BYTES, backupCount=LOG_BACKUP_COUNT)
+    _log_handler.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", datefmt="%Y-%m-%d %H:%M:%S"))
+    _file_logger.addHandler(_log_handler)
+except OSError as e:
+    print(f"[ERROR] Failed to open log file: {str(e)}")
+
+
 def log(message: str):
-    timestamped_message = f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}"
+    # time.strftime skips the datetime object construction of
+    # datetime.now().strftime and is measurably cheaper per call; log() sits
+    # on every hot path so the difference compounds.
+    timestamped_message = f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {message}"
     print(timestamped_message)
     sys.stdout.flush()
 
     try:
-        with FileLock(LOG_FILE + ".lock"):
-            lines = []
-            if os.path.exists(LOG_FILE):
-                with open(LOG_FILE, "r") as f:
-                    lines = f.read().splitlines()
-
-            lines.append(timestamped_message)
-            lines = lines[-MAX_LOG_LINES:]
-
-            with open(LOG_FILE, "w") as f:
-                f.write("\n".join(lines) + "\n")
+        _file_logger.info(message)
     except Exception as e:
         print(f"[ERROR] Failed to write to log file: {str(e)}")
 
@@ -140,15 +263,17 @@ def log(message: str):
 # --------------------------------------------------------------------------------------
 # _sleep_with_backoff(base_backoff, attempt, jitter=True)
 # ------------------------------------------------------
-# Implements exponential backoff with optional jitter.
-# Jitter is important in distributed systems to avoid the "thundering herd" problem where
-# many clients retry at the same time and re-trigger rate limiting.
+# Implements capped "full jitter" backoff: the sleep is drawn uniformly from
+# [0, min(base * 2^(attempt-1), MAX_BACKOFF)]. Deterministic exponential waits
+# (even with a small additive fuzz) leave many clients retrying in near
+# lock-step and re-triggering the rate limit that delayed them; full jitter
+# spreads the retries across the whole window. jitter=False keeps the plain
+# capped exponential wait for callers that need predictable spacing.
 # --------------------------------------------------------------------------------------
 
 def _sleep_with_backoff(base_backoff, attempt, jitter=True):
-    wait_time = min(base_backoff * (2 ** (attempt - 1)), MAX_BACKOFF)
-    if jitter:
-        wait_time += random.uniform(0.1, 0.5)
+    ceiling = min(base_backoff * (2 ** (attempt - 1)), MAX_BACKOFF)
+    wait_time = random.uniform(0, ceiling) if jitter else ceiling
     log(f"[DEBUG] Waiting {wait_time:.2f}s before retrying...")
     time.sleep(wait_time)
 
@@ -164,21 +289,45 @@ def _sleep_with_backoff(base_backoff, attempt, jitter=True):
 # This is used for Linode API calls so transient failures don't cause allocation failures.
 # --------------------------------------------------------------------------------------
 
-def api_request_with_retry(url, headers, retries=3, backoff=2, jitter=True):
+# url -> (etag, parsed body) for calls made with revalidate=True below.
+# Unbounded in principle, but keyed per instance so it tracks fleet size.
+_ETAG_CACHE = {}
+
+
+def api_request_with_retry(url, headers, retries=3, backoff=2, jitter=True, revalidate=False):
+    # With revalidate=True the parsed body is remembered per URL together with
+    # the ETag the Linode API sent, and later calls carry If-None-Match. A 304
+    # answer costs headers only — no body transfer, no JSON parse — which is
+    # the common case for config data that rarely changes between scans.
+    etag_entry = _ETAG_CACHE.get(url) if revalidate else None
+
     for attempt in range(1, retries + 1):
         try:
-            response = requests.get(url, headers=headers, timeout=8)
+            req_headers = headers
+            if etag_entry is not None:
+                req_headers = {**headers, "If-None-Match": etag_entry[0]}
+            response = SESSION.get(url, headers=req_headers, timeout=8)
+
+            if response.status_code == 304 and etag_entry is not None:
+                return etag_entry[1]
 
             if response.status_code == 200:
                 try:
-                    return response.json()
+                    body = response.json()
                 except ValueError:
                     log(f"[ERROR] Invalid JSON response on attempt {attempt}: {response.text}")
                     return None
+                if revalidate:
+                    etag = response.headers.get("ETag")
+                    if etag:
+                        _ETAG_CACHE[url] = (etag, body)
+                return body
 
             if response.status_code == 429:
-                wait_time = int(response.headers.get("Retry-After", 5))
-                log(f"[WARN] Rate limited (429). Retrying after {wait_time}s (attempt {attempt}/{retries})")
+                # Honor Retry-After but add up to 1s of jitter so clients that
+                # were throttled together don't all come back together.
+                wait_time = int(response.headers.get("Retry-After", 5)) + random.uniform(0, 1)
+                log(f"[WARN] Rate limited (429). Retrying after {wait_time:.2f}s (attempt {attempt}/{retries})")
                 time.sleep(wait_time)
                 continue
 
@@ -214,6 +363,40 @@ def api_request_with_retry(url, headers, retries=3, backoff=2, jitter=True):
 # sometimes keys stored 'IP', sometimes 'IP/CIDR'. Normalizing prevents logic bugs.
 # --------------------------------------------------------------------------------------
 
+# --------------------------------------------------------------------------------------
+# cached_api_get(url, headers, ttl_seconds)
+# -----------------------------------------
+# TTL cache in front of api_request_with_retry, keyed by URL.
+# - Fresh entry  -> returned without touching the network.
+# - Expired      -> refetched; on success the cache is updated.
+# - Fetch failed -> the stale entry (if any) is served so read-mostly endpoints
+#                   like /health keep answering during short Linode outages.
+#
+# Use this only for slow-moving resources (account, regions); allocation paths
+# must keep talking to the live API/etcd.
+# --------------------------------------------------------------------------------------
+
+HTTP_GET_CACHE = {}
+
+
+def cached_api_get(url, headers, ttl_seconds):
+    now = time.time()
+    entry = HTTP_GET_CACHE.get(url)
+    if entry and (now - entry["timestamp"]) < ttl_seconds:
+        return entry["data"]
+
+    data = api_request_with_retry(url, headers)
+    if data is not None:
+        HTTP_GET_CACHE[url] = {"timestamp": now, "data": data}
+        return data
+
+    if entry is not None:
+        log(f"[WARN] Upstream fetch failed for {url}; serving stale cached response")
+        return entry["data"]
+
+    return None
+
+
 def normalize_ip(s: str) -> str:
     """
     Normalize anything like '192.168.0.10', '192.168.0.10/24', ' 192.168.0.10/24 '
@@ -225,6 +408,53 @@ def normalize_ip(s: str) -> str:
     return s.split("/", 1)[0].strip()
 
 
+# Precomputed etcd key prefix for the hot key-parsing path below. Parsing is a
+# fixed-length slice plus one split — no regex, no per-key str.replace scan —
+# and it operates on the raw bytes from etcd so only the IP portion of each
+# key is ever decoded.
+_ETCD_KEY_PREFIX = b"/vlan/ip/"
+
+
+# IP <-> int conversion for the allocator's per-IP loops. inet_aton/inet_ntoa
+# are C functions; ipaddress.IPv4Address validates and allocates a full object
+# per call, which dominates when converting tens of thousands of IPs while
+# building the used-set bitmap. ipaddress is still used once per request for
+# subnet parsing, where its validation is worth the cost. Invalid strings
+# raise OSError (inet_aton) rather than ValueError.
+
+
+def _encode_payload(payload: dict) -> bytes:
+    """
+    Serialize an allocation record for storage as an etcd value. JSON instead
+    of YAML: PyYAML's pure-Python emitter is orders of magnitude slower than
+    orjson (or even stdlib json) and ran once per synced/allocated key. The
+    values are write-only bookkeeping — nothing in the scripts parses them —
+    so the format change is safe for existing tooling.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
+
+def ip_to_int(s: str) -> int:
+    return int.from_bytes(inet_aton(s), "big")
+
+
+def int_to_ip(n: int) -> str:
+    return inet_ntoa(n.to_bytes(4, "big"))
+
+
+def bare_ip_from_key(key: bytes) -> str:
+    """
+    Extract the bare IP from an etcd key in either historical style:
+    b'/vlan/ip/192.168.0.10' or b'/vlan/ip/192.168.0.10/24' -> '192.168.0.10'.
+    Returns "" for keys outside the /vlan/ip/ prefix.
+    """
+    if not key.startswith(_ETCD_KEY_PREFIX):
+        return ""
+    return key[len(_ETCD_KEY_PREFIX):].split(b"/", 1)[0].decode("utf-8").strip()
+
+
 # --------------------------------------------------------------------------------------
 # fetch_linode_token()
 # --------------------
@@ -235,16 +465,36 @@ def normalize_ip(s: str) -> str:
 #
 # NOTE: In hardened setups, you'd prefer passing the token via a Kubernetes Secret or
 # environment variable rather than reading from a file path.
+#
+# Caching:
+# - The token is parsed once and cached keyed on the config file's mtime, so the
+#   hot paths (/allocate, /health) only pay a stat() instead of a full ini parse
+#   on every call. Editing the config file on disk invalidates the cache.
 # --------------------------------------------------------------------------------------
 
+_TOKEN_CACHE = {"token": None, "mtime": None}
+
+
 def fetch_linode_token(config_file="/root/.linode-cli/linode-cli"):
-    if not os.path.exists(config_file):
+    try:
+        mtime = os.stat(config_file).st_mtime
+    except FileNotFoundError:
         log(f"[ERROR] Configuration file {config_file} not found")
         return None
+    except OSError as e:
+        log(f"[ERROR] Failed to stat configuration file: {str(e)}")
+        return None
 
-    cfg = configparser.ConfigParser()
+    if _TOKEN_CACHE["token"] is not None and _TOKEN_CACHE["mtime"] == mtime:
+        return _TOKEN_CACHE["token"]
+
+    # interpolation=None: linode-cli config values are opaque tokens, and the
+    # default BasicInterpolation would both scan every value for '%' and choke
+    # on tokens that happen to contain one.
+    cfg = configparser.ConfigParser(interpolation=None)
     try:
-        cfg.read(config_file)
+        with open(config_file) as fh:
+            cfg.read_file(fh)
 
         if "DEFAULT" not in cfg or "default-user" not in cfg["DEFAULT"]:
             log(f"[ERROR] No 'default-user' found in {config_file}")
@@ -260,6 +510,8 @@ def fetch_linode_token(config_file="/root/.linode-cli/linode-cli"):
             log(f"[ERROR] No token found for user '{default_user}' in {config_file}")
             return None
 
+        _TOKEN_CACHE["token"] = token
+        _TOKEN_CACHE["mtime"] = mtime
         return token
     except Exception as e:
         log(f"[ERROR] Exception while reading configuration file: {str(e)}")
@@ -281,22 +533,45 @@ def fetch_linode_token(config_file="/root/.linode-cli/linode-cli"):
 #   Returns a list of BARE IPs, e.g. ['192.168.0.9', '192.168.0.10', ...]
 #
 # Caching:
-#   VLAN_IP_CACHE is used to reduce API calls, but TTL is configurable via env var.
-#   In your latest version CACHE_TTL_SECONDS=0 disables caching (always fresh).
+#   VLAN_IP_CACHE is used to reduce API calls; TTL is configurable via env var.
+#   When the cache is merely stale (not empty), the stale set is returned and a
+#   refresh is queued to the background sync worker, so /allocate never blocks
+#   on a full fleet scan once the cache is warm. Staleness is safe: this set is
+#   a prefilter and the etcd transaction still arbitrates every allocation.
+#   CACHE_TTL_SECONDS=0 restores fully synchronous fetches.
 # --------------------------------------------------------------------------------------
 
-def fetch_assigned_ips():
+def fetch_assigned_ips(force_refresh=False):
     # Cache
-    if (
-        VLAN_IP_CACHE["ips"] is not None
-        and VLAN_IP_CACHE["timestamp"] is not None
-        and (datetime.now() - VLAN_IP_CACHE["timestamp"]).total_seconds() < VLAN_IP_CACHE["ttl_seconds"]
-    ):
-        log("[INFO] Using cached VLAN IPs")
-        return VLAN_IP_CACHE["ips"]
-
+    if not force_refresh and VLAN_IP_CACHE["ips"] is not None and VLAN_IP_CACHE["timestamp"] is not None:
+        age = (datetime.now() - VLAN_IP_CACHE["timestamp"]).total_seconds()
+        if age < VLAN_IP_CACHE["ttl_seconds"] + VLAN_IP_CACHE["ttl_jitter"]:
+            log("[INFO] Using cached VLAN IPs")
+            return VLAN_IP_CACHE["ips"]
+        if VLAN_IP_CACHE["ttl_seconds"] > 0:
+            # Stale-while-revalidate: serve the stale set now and let the
+            # background worker refresh it off the request path.
+            try:
+                LINODE_SYNC_QUEUE.put_nowait(True)
+            except queue.Full:
+                pass  # a refresh is already pending
+            log(f"[INFO] Using stale cached VLAN IPs (age {age:.0f}s); refresh queued")
+            return VLAN_IP_CACHE["ips"]
+
+    # Cold cache (or forced refresh): single-flight. Only one thread runs the
+    # fleet crawl; concurrent callers block on the lock, re-check, and find
+    # the cache the winner just filled instead of piling onto the Linode API.
+    with _VLAN_FETCH_LOCK:
+        if not force_refresh and VLAN_IP_CACHE["ips"] is not None and VLAN_IP_CACHE["timestamp"] is not None:
+            age = (datetime.now() - VLAN_IP_CACHE["timestamp"]).total_seconds()
+            if age < VLAN_IP_CACHE["ttl_seconds"] + VLAN_IP_CACHE["ttl_jitter"]:
+                log("[INFO] Using VLAN IPs cached by a concurrent fetch")
+                return VLAN_IP_CACHE["ips"]
+        return _crawl_assigned_ips()
+
+
+def _crawl_assigned_ips():
     LINODE_TOKEN = fetch_linode_token()
-    REGION = os.getenv("REGION")
     if not REGION:
         log("[ERROR] REGION environment variable not set")
         return []
@@ -308,58 +583,206 @@ def fetch_assigned_ips():
     headers = {"Authorization": f"Bearer {LINODE_TOKEN}"}
     log(f"[DEBUG] Fetching Linode instances in region: {REGION}")
 
-    vlan_ips = []
-    page = 1
-    total_pages = 1
-
-    while page <= total_pages:
-        url = f"https://api.linode.com/v4/linode/instances?page={page}&page_size=100"
-        response = api_request_with_retry(url, headers={**headers, "X-Filter": f'{{"region": "{REGION}"}}'})
-        if not response or "data" not in response:
-            log(f"[ERROR] Failed to fetch instances on page {page}")
-            break
-
-        if page == 1:
-            total_pages = response.get("pages", 1)
-            log(f"[DEBUG] Total pages of instances: {total_pages}")
+    # ---- Page 1 tells us how many pages exist; remaining pages are fetched
+    # concurrently. page_size=500 (the API maximum) keeps the page count low
+    # for large fleets.
+    filter_headers = {**headers, "X-Filter": X_FILTER_REGION}
 
-        for linode in response["data"]:
-            linode_id = linode.get("id")
-            if not linode_id:
-                continue
-
-            config_list_url = f"https://api.linode.com/v4/linode/instances/{linode_id}/configs"
-            configs = api_request_with_retry(config_list_url, headers=headers)
-            if not configs or "data" not in configs:
-                continue
+    def fetch_instances_page(p):
+        return api_request_with_retry(LINODE_INSTANCES_URL + str(p), headers=filter_headers)
 
-            for c in configs["data"]:
-                cid = c.get("id")
-                if not cid:
-                    continue
-
-                config_view_url = f"https://api.linode.com/v4/linode/instances/{linode_id}/configs/{cid}"
-                config_view = api_request_with_retry(config_view_url, headers=headers)
-                if not config_view or "interfaces" not in config_view:
-                    continue
+    first_page = fetch_instances_page(1)
+    if not first_page or "data" not in first_page:
+        log("[ERROR] Failed to fetch instances on page 1")
+        return []
 
-                for iface in config_view["interfaces"]:
-                    if iface.get("purpose") == "vlan":
-                        ipam = iface.get("ipam_address")
-                        if ipam:
-                            ip = normalize_ip(ipam)
-                            if ip:
-                                vlan_ips.append(ip)
-                                log(f"[DEBUG] Found VLAN IP from Linode: {ip}")
+    instances = list(first_page["data"])
+    total_pages = first_page.get("pages", 1)
+    log(f"[DEBUG] Total pages of instances: {total_pages}")
+
+    # Bounded fan-out: cap in-flight requests so a very large fleet cannot
+    # trigger Linode API rate limiting (429s). Tunable via env; shared by the
+    # page fetches and the per-instance config fetches below.
+    fan_out = int(os.getenv("LINODE_FETCH_CONCURRENCY", 8))
+
+    if total_pages > 1:
+        with ThreadPoolExecutor(max_workers=min(fan_out, total_pages - 1)) as pool:
+            for p, response in zip(range(2, total_pages + 1),
+                                   pool.map(fetch_instances_page, range(2, total_pages + 1))):
+                if response and "data" in response:
+                    instances.extend(response["data"])
+                else:
+                    log(f"[ERROR] Failed to fetch instances on page {p}")
+
+    # ---- Per-instance config fetches run concurrently too: with a serial
+    # loop the configs phase costs one HTTPS round trip per Linode, which
+    # dominates the whole scan on fleets of any size. The calls share the
+    # pooled module Session, so threads reuse warm TLS connections.
+    def fetch_instance_vlan_ips(linode):
+        linode_id = linode.get("id")
+        if not linode_id:
+            return []
+
+        # The configs list response already embeds each config's interfaces,
+        # so one call per Linode is enough — no per-config detail GETs.
+        config_list_url = f"https://api.linode.com/v4/linode/instances/{linode_id}/configs"
+        configs = api_request_with_retry(config_list_url, headers=headers, revalidate=True)
+        if not configs or "data" not in configs:
+            return []
+
+        found = []
+        for c in configs["data"]:
+            for iface in c.get("interfaces") or []:
+                if iface.get("purpose") == "vlan":
+                    ipam = iface.get("ipam_address")
+                    if ipam:
+                        ip = normalize_ip(ipam)
+                        if ip:
+                            found.append(ip)
+                            log(f"[DEBUG] Found VLAN IP from Linode: {ip}")
+        return found
 
-        page += 1
+    vlan_ips = []
+    if instances:
+        with ThreadPoolExecutor(max_workers=min(fan_out, len(instances))) as pool:
+            for found in pool.map(fetch_instance_vlan_ips, instances):
+                vlan_ips.extend(found)
 
     VLAN_IP_CACHE["ips"] = vlan_ips
     VLAN_IP_CACHE["timestamp"] = datetime.now()
+    VLAN_IP_CACHE["ttl_jitter"] = random.uniform(0, 0.1 * VLAN_IP_CACHE["ttl_seconds"])
     log(f"[INFO] Total VLAN IPs fetched: {len(vlan_ips)}")
     return vlan_ips
 
 
+# --------------------------------------------------------------------------------------
+# Background Linode sync worker
+# -----------------------------
+# Drains LINODE_SYNC_QUEUE and refreshes VLAN_IP_CACHE outside the request
+# thread. Together with the single-slot queue this coalesces any number of
+# concurrent "cache is stale" signals into one fleet scan.
+# --------------------------------------------------------------------------------------
+
+def _linode_sync_worker():
+    while True:
+        LINODE_SYNC_QUEUE.get()
+        try:
+            fetch_assigned_ips(force_refresh=True)
+        except Exception as e:
+            log(f"[ERROR] Background Linode sync failed: {str(e)}")
+        finally:
+            LINODE_SYNC_QUEUE.task_done()
+
+
+# --------------------------------------------------------------------------------------
+# Periodic etcd MVCC compaction (opt-in)
+# --------------------------------------
+# allocate/release churn leaves old revisions behind; uncompacted history
+# slowly inflates range-scan and watch-backfill cost. When
+# ETCD_COMPACT_INTERVAL_SECONDS > 0, a daemon thread periodically compacts
+# away everything older than the last ETCD_COMPACT_KEEP_REVISIONS revisions.
+# An etcd lease-backed lock elects a single compactor, so the three replicas
+# do not dogpile the cluster. Defragmentation is deliberately left to ops:
+# it blocks the member it runs on.
+# --------------------------------------------------------------------------------------
+
+def _etcd_compact_worker(interval, keep_revisions):
+    while True:
+        time.sleep(interval)
+        try:
+            etcd = get_etcd_connection()
+            lock = etcd.lock("vlan-compactor", ttl=max(60, interval))
+            if not lock.acquire(timeout=1):
+                continue  # another replica is the compactor this round
+            try:
+                rev = etcd.get_response("/vlan/ip/").header.revision
+                if rev > keep_revisions:
+                    etcd.compact(rev - keep_revisions)
+                    log(f"[INFO] Compacted etcd history up to revision {rev - keep_revisions}")
+            finally:
+                lock.release()
+        except Exception as e:
+            # "required revision has been compacted" just means someone beat
+            # us to it; everything here is best-effort housekeeping.
+            log(f"[WARN] etcd compaction pass failed: {str(e)}")
+
+
+# --------------------------------------------------------------------------------------
+# start_background_workers()
+# --------------------------
+# Starts the per-process daemon threads (Linode sync, optional compaction).
+# This is deliberately NOT done at import time: with gunicorn's preload_app
+# the module imports once in the master, and threads started there do not
+# survive the fork into workers — leaving each worker with a full
+# LINODE_SYNC_QUEUE and no consumer, i.e. a cache that never refreshes.
+# Instead the gunicorn post_fork hook (and the dev __main__ entrypoint) calls
+# this once per process. Idempotent, so repeated calls are harmless.
+# --------------------------------------------------------------------------------------
+
+_WORKERS_STARTED = False
+_WORKERS_GUARD = threading.Lock()
+
+
+def start_background_workers():
+    global _WORKERS_STARTED, _ETCD_CLIENT
+    with _WORKERS_GUARD:
+        if _WORKERS_STARTED:
+            return
+        _WORKERS_STARTED = True
+
+    # Shed anything inherited from a preloaded master before threads start:
+    # a set watch event would mask a watch thread that no longer exists in
+    # this process (pinning get_etcd_used_ips to the fork-time snapshot), and
+    # a pre-fork gRPC channel is not fork-safe — its first use in the child
+    # can hang instead of raising. The first caller re-dials etcd fresh.
+    _ETCD_WATCH_ACTIVE.clear()
+    with _ETCD_CLIENT_LOCK:
+        _ETCD_CLIENT = None
+
+    threading.Thread(target=_linode_sync_worker, name="linode-sync", daemon=True).start()
+
+    if os.getenv("ETCD_WATCH_USED_SET", "1") != "0":
+        threading.Thread(target=_etcd_watch_worker, name="etcd-watch", daemon=True).start()
+
+    compact_interval = int(os.getenv("ETCD_COMPACT_INTERVAL_SECONDS", 0))
+    if compact_interval > 0:
+        threading.Thread(
+            target=_etcd_compact_worker,
+            args=(compact_interval, int(os.getenv("ETCD_COMPACT_KEEP_REVISIONS", 10_000))),
+            name="etcd-compact",
+            daemon=True,
+        ).start()
+
+
+# --------------------------------------------------------------------------------------
+# region_is_valid(headers)
+# ------------------------
+# Confirms that the configured REGION actually exists on the Linode side,
+# refreshing lazily through REGION_CACHE (TTL above). A failed lookup while a
+# previous validation is still cached does not flip the region to invalid.
+# --------------------------------------------------------------------------------------
+
+def region_is_valid(headers):
+    if not REGION:
+        return False
+
+    if (
+        REGION_CACHE["timestamp"] is not None
+        and (datetime.now() - REGION_CACHE["timestamp"]).total_seconds() < REGION_CACHE["ttl_seconds"]
+    ):
+        return REGION_CACHE["valid"]
+
+    data = cached_api_get(f"https://api.linode.com/v4/regions/{REGION}", headers, ttl_seconds=REGION_CACHE["ttl_seconds"])
+    if data is None:
+        # Upstream unreachable: keep whatever we knew before rather than
+        # flapping between valid/invalid.
+        return REGION_CACHE["valid"]
+
+    REGION_CACHE["valid"] = data.get("id") == REGION
+    REGION_CACHE["timestamp"] = datetime.now()
+    return REGION_CACHE["valid"]
+
+
 # --------------------------------------------------------------------------------------
 # system_health_check()
 # ---------------------
@@ -388,67 +811,226 @@ def system_health_check():
 # Connects to the first healthy etcd endpoint from ETCD_ENDPOINTS.
 # - Accepts endpoints in 'host:port' or 'http(s)://host:port' forms.
 # - Calls client.status() as a health check.
+# - The connection is opened once and cached for the lifetime of the process.
+#   Re-dialing etcd (TCP + gRPC channel setup) on every request adds avoidable
+#   latency to /allocate and /release, so we keep one client and only rebuild it
+#   if the cached one stops responding.
 #
 # NOTE:
 # - This uses unauthenticated etcd connectivity. If etcd is secured with TLS/auth,
 #   additional parameters are needed (ca_cert, cert/key, username/password).
 # --------------------------------------------------------------------------------------
 
+_ETCD_CLIENT = None
+_ETCD_CLIENT_LOCK = threading.Lock()
+
+# gRPC keepalive pings stop idle NATs / LB conntrack from silently dropping
+# the channel between allocation bursts, which would otherwise surface as a
+# slow reconnect on the next /allocate.
+_ETCD_GRPC_OPTIONS = [
+    ("grpc.keepalive_time_ms", 30_000),
+    ("grpc.keepalive_timeout_ms", 10_000),
+]
+
+
 def get_etcd_connection():
-    endpoints = os.getenv("ETCD_ENDPOINTS", "")
-    if not endpoints:
-        raise EnvironmentError("ETCD_ENDPOINTS not set in environment")
-
-    for ep in endpoints.split(","):
-        ep = ep.strip().replace("http://", "").replace("https://", "").rstrip("/")
-        parts = ep.split(":")
-        if len(parts) != 2:
-            log(f"[ERROR] Invalid ETCD endpoint format: {ep}. Expected format: host:port")
-            continue
+    global _ETCD_CLIENT
+
+    # Reuse the cached client if it is still healthy; otherwise fall through
+    # and dial a fresh connection below. The lock makes lazy init safe under
+    # gthread workers: without it, a cold burst of requests would each dial
+    # its own channel and all but one would be leaked.
+    with _ETCD_CLIENT_LOCK:
+        if _ETCD_CLIENT is not None:
+            try:
+                _ETCD_CLIENT.status()
+                return _ETCD_CLIENT
+            except Exception as e:
+                log(f"[WARN] Cached etcd connection unhealthy, reconnecting: {str(e)}")
+                _ETCD_CLIENT = None
+
+        endpoints = os.getenv("ETCD_ENDPOINTS", "")
+        if not endpoints:
+            raise EnvironmentError("ETCD_ENDPOINTS not set in environment")
+
+        for ep in endpoints.split(","):
+            ep = ep.strip().replace("http://", "").replace("https://", "").rstrip("/")
+            parts = ep.split(":")
+            if len(parts) != 2:
+                log(f"[ERROR] Invalid ETCD endpoint format: {ep}. Expected format: host:port")
+                continue
 
-        host = parts[0]
-        try:
-            port = int(parts[1])
-        except ValueError:
-            log(f"[ERROR] Port is not a valid integer in endpoint: {ep}")
-            continue
+            host = parts[0]
+            try:
+                port = int(parts[1])
+            except ValueError:
+                log(f"[ERROR] Port is not a valid integer in endpoint: {ep}")
+                continue
 
-        try:
-            c = etcd3.client(host=host, port=port)
-            c.status()
-            log(f"[INFO] Connected to etcd: {host}:{port}")
-            return c
-        except Exception as e:
-            log(f"[WARN] Failed to connect to etcd endpoint {host}:{port}: {str(e)}")
-            continue
+            try:
+                c = etcd3.client(host=host, port=port, grpc_options=_ETCD_GRPC_OPTIONS)
+                c.status()
+                log(f"[INFO] Connected to etcd: {host}:{port}")
+                _ETCD_CLIENT = c
+                return c
+            except Exception as e:
+                log(f"[WARN] Failed to connect to etcd endpoint {host}:{port}: {str(e)}")
+                continue
 
-    raise ConnectionError("Unable to connect to any etcd endpoint")
+        raise ConnectionError("Unable to connect to any etcd endpoint")
 
 
 # --------------------------------------------------------------------------------------
 # get_etcd()
 # ----------
-# Similar to get_etcd_connection(), but intended for lightweight reads (listing IPs).
-# It returns the first endpoint that responds to status().
+# Kept as the entry point the read paths (listing IPs) call, but now a thin
+# alias over get_etcd_connection() so every handler shares the one cached
+# gRPC channel instead of dialing a throwaway client per request.
 # --------------------------------------------------------------------------------------
 
 def get_etcd():
-    endpoints = os.getenv("ETCD_ENDPOINTS", "").split(",")
-    for ep in endpoints:
-        ep = ep.strip().replace("http://", "").replace("https://", "").rstrip("/")
-        if not ep:
+    try:
+        return get_etcd_connection()
+    except (EnvironmentError, ConnectionError) as e:
+        raise RuntimeError(f"No healthy etcd endpoints: {str(e)}")
+
+
+# --------------------------------------------------------------------------------------
+# _scan_prefix_keys(etcd, prefix, batch)
+# --------------------------------------
+# Yields the raw key bytes under `prefix` in ascending order, fetched in
+# bounded Range pages of `batch` keys instead of one unbounded get_prefix
+# response. A 100k-key inventory arrives as a handful of modest gRPC messages
+# rather than one response large enough to trip message-size limits, and
+# memory stays bounded by the page size. Uses the low-level KV stub because
+# the high-level get_prefix API exposes no limit/continuation.
+# --------------------------------------------------------------------------------------
+
+def _scan_prefix_keys(etcd, prefix, batch):
+    start = to_bytes(prefix)
+    range_end = prefix_range_end(start)
+    while True:
+        req = etcdrpc.RangeRequest(
+            key=start,
+            range_end=range_end,
+            limit=batch,
+            keys_only=True,
+            sort_order=etcdrpc.RangeRequest.ASCEND,
+            sort_target=etcdrpc.RangeRequest.KEY,
+        )
+        resp = etcd.kvstub.Range(
+            req, etcd.timeout,
+            credentials=etcd.call_credentials,
+            metadata=etcd.metadata,
+        )
+        for kv in resp.kvs:
+            yield kv.key
+        if not resp.more or not resp.kvs:
+            return
+        # Continue just past the last key of this page.
+        start = resp.kvs[-1].key + b"\x00"
+
+
+# --------------------------------------------------------------------------------------
+# get_etcd_used_ips(etcd)
+# -----------------------
+# Returns the set of bare IPs currently recorded under /vlan/ip/, backed by
+# ETCD_USED_CACHE. A full prefix scan only happens when the cache has expired;
+# in between, allocate/release/sync patch the set in place.
+#
+# Always returns a caller-owned COPY, never the live cache set: the watch
+# thread (and concurrent request threads) mutate ETCD_USED_CACHE["ips"] in
+# place, and handing out the live object makes every iteration over it —
+# set differences, build_mask, batch scans — a "set changed size during
+# iteration" RuntimeError waiting to happen. The copy is a single C-level
+# pass over a few thousand strings, far cheaper than the scan it replaces.
+# --------------------------------------------------------------------------------------
+
+def get_etcd_used_ips(etcd):
+    # While the watch stream is healthy the cache is maintained event-by-event
+    # and never goes stale, so the TTL (and the rescans it triggers) only
+    # matter as the fallback when the watch is down or disabled.
+    if _ETCD_WATCH_ACTIVE.is_set():
+        return set(ETCD_USED_CACHE["ips"])
+
+    if (
+        ETCD_USED_CACHE["timestamp"] is not None
+        and (datetime.now() - ETCD_USED_CACHE["timestamp"]).total_seconds() < ETCD_USED_CACHE["ttl_seconds"]
+    ):
+        return set(ETCD_USED_CACHE["ips"])
+
+    used = set()
+    # keys_only: the values (YAML allocation payloads) never leave etcd, so the
+    # scan moves a fraction of the bytes a full range GET would.
+    for _value, meta in etcd.get_prefix("/vlan/ip/", keys_only=True):
+        if not meta.key:
             continue
-        if ":" in ep:
-            host, port = ep.split(":")
-        else:
-            host, port = ep, "2379"
+        bare = bare_ip_from_key(meta.key)            # handles both '<ip>' and '<ip>/<cidr>' keys
+        if bare:
+            used.add(bare)
+
+    ETCD_USED_CACHE["ips"] = used
+    ETCD_USED_CACHE["timestamp"] = datetime.now()
+    return set(used)
+
+
+# --------------------------------------------------------------------------------------
+# Background etcd watch worker
+# ----------------------------
+# Keeps ETCD_USED_CACHE current incrementally instead of by periodic rescans:
+# seed the set with one prefix scan, then apply PUT/DELETE events from a
+# watch_prefix stream as they arrive. While the stream is up, allocate/release
+# see an always-fresh set with zero extra etcd round trips; if it drops, the
+# worker reseeds with full-jitter backoff and get_etcd_used_ips falls back to
+# its TTL rescans in the meantime. The watch also folds in writes made by the
+# OTHER replicas, which the request-thread cache patching cannot see.
+# Started per process by start_background_workers (never at import — see the
+# fork note there). Disable with ETCD_WATCH_USED_SET=0.
+# --------------------------------------------------------------------------------------
+
+_ETCD_WATCH_ACTIVE = threading.Event()
+
+
+def _etcd_watch_worker():
+    attempt = 0
+    while True:
+        cancel = None
         try:
-            c = etcd3.client(host=host, port=int(port))
-            c.status()
-            return c
-        except Exception:
-            continue
-    raise RuntimeError("No healthy etcd endpoints")
+            etcd = get_etcd_connection()
+
+            used = set()
+            for key in _scan_prefix_keys(etcd, ETCD_PREFIX, 2000):
+                bare = bare_ip_from_key(key)
+                if bare:
+                    used.add(bare)
+            ETCD_USED_CACHE["ips"] = used
+            ETCD_USED_CACHE["timestamp"] = datetime.now()
+
+            events_iterator, cancel = etcd.watch_prefix(ETCD_PREFIX)
+            _ETCD_WATCH_ACTIVE.set()
+            attempt = 0
+            log(f"[INFO] etcd watch established on {ETCD_PREFIX} ({len(used)} keys seeded)")
+
+            for event in events_iterator:
+                bare = bare_ip_from_key(event.key)
+                if not bare:
+                    continue
+                if isinstance(event, etcd3.events.DeleteEvent):
+                    ETCD_USED_CACHE["ips"].discard(bare)
+                else:
+                    ETCD_USED_CACHE["ips"].add(bare)
+                ETCD_USED_CACHE["timestamp"] = datetime.now()
+        except Exception as e:
+            log(f"[WARN] etcd watch stream dropped: {str(e)}")
+        finally:
+            _ETCD_WATCH_ACTIVE.clear()
+            if cancel is not None:
+                try:
+                    cancel()
+                except Exception:
+                    pass
+        attempt += 1
+        _sleep_with_backoff(1, attempt)
 
 
 # --------------------------------------------------------------------------------------
@@ -459,8 +1041,14 @@ def get_etcd():
 # - Falls back to local kubeconfig (when running on a workstation/VM with kubeconfig)
 #
 # This is used by /api/v1/refresh endpoints to create and inspect Kubernetes Jobs.
+#
+# Memoized: loading the config re-reads the service-account token and CA
+# bundle and builds a fresh TLS pool on every call otherwise. One shared
+# ApiClient (the kubernetes library's clients are thread-safe for requests)
+# serves all refresh/status calls for the life of the process.
 # --------------------------------------------------------------------------------------
 
+@functools.lru_cache(maxsize=1)
 def k8s_api():
     try:
         config.load_incluster_config()
@@ -479,23 +1067,35 @@ def k8s_api():
 #
 # This matches your "reserve first two and last" intent in many /24 networks.
 # Adjust if your gateway is different.
+#
+# parse_subnet memoizes the ip_network() parse itself: callers send the same
+# one or two subnet strings on every request, and the parse re-validates and
+# re-builds the network object each time otherwise. ValueError for malformed
+# input propagates to the caller exactly as the direct call would.
 # --------------------------------------------------------------------------------------
 
-def reserved_set(ip_net: ipaddress.IPv4Network) -> set:
+@functools.lru_cache(maxsize=256)
+def parse_subnet(subnet: str) -> ipaddress.IPv4Network:
+    return ipaddress.ip_network(subnet, strict=False)
+
+
+@functools.lru_cache(maxsize=256)
+def reserved_set(ip_net: ipaddress.IPv4Network) -> frozenset:
     """
     Reserved:
       - network address (x.x.x.0)
       - first usable host (x.x.x.1 if available)
       - broadcast address (x.x.x.255)
+
+    Cached per network: every /allocate and /release consults this, and the
+    old list(ip_net.hosts()) materialized the entire pool (65k address
+    objects on a /16) just to read the first element. The first host is
+    network_address + 1 by definition, so it is computed directly.
     """
-    res = set()
-    res.add(str(ip_net.network_address))
-    res.add(str(ip_net.broadcast_address))
-    # first usable host if any
-    hosts = list(ip_net.hosts())
-    if hosts:
-        res.add(str(hosts[0]))
-    return res
+    res = {str(ip_net.network_address), str(ip_net.broadcast_address)}
+    if ip_net.num_addresses > 2:
+        res.add(str(ip_net.network_address + 1))
+    return frozenset(res)
 
 
 # --------------------------------------------------------------------------------------
@@ -527,34 +1127,6 @@ def reserved_set(ip_net: ipaddress.IPv4Network) -> set:
 # --------------------------------------------------------------------------------------
 
 @app.route("/allocate", methods=["POST"])
-# --------------------------------------------------------------------------------------
-# POST /allocate
-# --------------
-# Input:
-#   {"subnet": "192.168.0.0/24"}
-#
-# Output (success):
-#   {
-#     "allocated_ip": "192.168.0.9/24",
-#     "ip": "192.168.0.9",
-#     "cidr": "/24"
-#   }
-#
-# Allocation flow (very important):
-# 1) Parse subnet -> iterate candidate host IPs
-# 2) Build a "used set" from:
-#      a) etcd keys (/vlan/ip/<ip> and possibly /vlan/ip/<ip>/<cidr>)
-#      b) Linode API (existing VLAN ipam_address values)
-# 3) For each candidate IP not reserved/not used:
-#      - Try etcd transaction:
-#          compare version(/vlan/ip/<ip>) == 0 AND version(/vlan/ip/<ip>/<cidr>) == 0
-#          then put /vlan/ip/<ip> = YAML payload
-#      - If transaction succeeds, return that IP.
-#
-# The compare-and-put (transaction) is what prevents two requesters from claiming the
-# same IP simultaneously.
-# --------------------------------------------------------------------------------------
-
 def allocate_ip():
     try:
         data = request.get_json(silent=True) or {}
@@ -563,13 +1135,12 @@ def allocate_ip():
             log("[ERROR] Subnet not provided")
             return jsonify({"error": "Subnet not provided"}), 400
 
-        REGION = os.getenv("REGION")
         if not REGION:
             log("[ERROR] REGION not provided")
             return jsonify({"error": "Region not provided"}), 400
 
         try:
-            ip_net = ipaddress.ip_network(subnet, strict=False)
+            ip_net = parse_subnet(subnet)
             cidr_suffix = f"/{ip_net.prefixlen}"
         except ValueError:
             log("[ERROR] Invalid subnet format")
@@ -577,25 +1148,20 @@ def allocate_ip():
 
         etcd = get_etcd_connection()
 
-        # ---- Build used IP set from etcd (normalize BOTH old + new styles) ----
-        etcd_used_bare = set()
-        for _value, meta in etcd.get_prefix("/vlan/ip/"):
-            if not meta.key:
-                continue
-            key = meta.key.decode("utf-8")
-            raw = key.replace("/vlan/ip/", "", 1)        # may be '192.168.0.10' or '192.168.0.10/24'
-            bare = normalize_ip(raw)
-            if bare:
-                etcd_used_bare.add(bare)
+        # ---- Build used IP set from etcd (cached; normalize BOTH old + new styles) ----
+        etcd_used_bare = get_etcd_used_ips(etcd)
 
         # ---- Add Linode assigned VLAN IPs (bare) ----
         linode_assigned_bare = set(fetch_assigned_ips() or [])
-        used_bare = etcd_used_bare.union(linode_assigned_bare)
 
-        # ---- Sync Linode IPs into etcd using canonical bare key (atomic-ish) ----
-        for bare in (linode_assigned_bare - etcd_used_bare):
-            key_bare = f"/vlan/ip/{bare}"
-            payload = {
+        # ---- Sync Linode IPs into etcd using canonical bare key ----
+        # All missing keys go into a single transaction (one round trip) instead
+        # of a txn per IP. If any key appeared concurrently the whole batch
+        # fails, so we fall back to per-key create-only txns in that case.
+        missing = sorted(linode_assigned_bare - etcd_used_bare)
+
+        def _sync_payload():
+            return {
                 "status": "allocated",
                 "source": "linode-sync",
                 "region": REGION,
@@ -604,41 +1170,246 @@ def allocate_ip():
                 "linode_id": None,
                 "notes": "Discovered via Linode API",
             }
+
+        # Chunked to stay inside etcd's --max-txn-ops limit (default 128 ops;
+        # each key contributes a compare and a put, so 64 keys per txn).
+        for i in range(0, len(missing), _SYNC_TXN_CHUNK):
+            batch = missing[i:i + _SYNC_TXN_CHUNK]
+            batched = False
             try:
-                etcd.transaction(
-                    compare=[etcd.transactions.version(key_bare) == 0],
-                    success=[etcd.transactions.put(key_bare, yaml.safe_dump(payload))],
+                batched, _ = etcd.transaction(
+                    compare=[etcd.transactions.version(f"/vlan/ip/{b}") == 0 for b in batch],
+                    success=[
+                        etcd.transactions.put(f"/vlan/ip/{b}", _encode_payload(_sync_payload()))
+                        for b in batch
+                    ],
                     failure=[],
                 )
-                log(f"[SYNC] Added Linode-assigned IP to etcd (bare key): {bare}")
             except Exception as e:
-                log(f"[WARN] Failed syncing {bare}: {str(e)}")
+                log(f"[WARN] Batched Linode sync txn failed: {str(e)}")
+
+            if batched:
+                ETCD_USED_CACHE["ips"].update(batch)
+                log(f"[SYNC] Added {len(batch)} Linode-assigned IP(s) to etcd in one txn")
+            else:
+                for bare in batch:
+                    key_bare = f"/vlan/ip/{bare}"
+                    try:
+                        etcd.transaction(
+                            compare=[etcd.transactions.version(key_bare) == 0],
+                            success=[etcd.transactions.put(key_bare, _encode_payload(_sync_payload()))],
+                            failure=[],
+                        )
+                        ETCD_USED_CACHE["ips"].add(bare)
+                        log(f"[SYNC] Added Linode-assigned IP to etcd (bare key): {bare}")
+                    except Exception as e:
+                        log(f"[WARN] Failed syncing {bare}: {str(e)}")
+
+        res = reserved_set(ip_net)
 
-        # Recompute
-        used_bare = used_bare.union(linode_assigned_bare)
+        subnet_key = str(ip_net)
+        first_host = int(ip_net.network_address) + 1
+        last_host = int(ip_net.broadcast_address)      # exclusive
+        # A /31 or /32 has no allocatable hosts and would make this negative,
+        # turning the bitmap shifts below into a ValueError; clamp to 0 so an
+        # empty pool falls through to the normal "No IPs available" response.
+        pool_size = max(0, last_host - first_host)
+
+        # ---- Used-set as a bitmap ----
+        # One Python int acts as the bitmap: bit i set means candidate
+        # first_host+i is taken. Building it is a single pass over the three
+        # "unavailable" sources, and picking the next free IP is a shift plus
+        # an isolate-lowest-bit trick — word-at-a-time C operations inside the
+        # int object instead of per-candidate hashing. A /16 pool is 8 KB this
+        # way versus megabytes as a set of dotted-quad strings.
+        def build_mask(ips):
+            mask = 0
+            for s in ips:
+                try:
+                    n = ip_to_int(s)
+                except (OSError, ValueError):
+                    continue
+                if first_host <= n < last_host:
+                    mask |= 1 << (n - first_host)
+            return mask
+
+        used_mask = build_mask(chain(etcd_used_bare, linode_assigned_bare, res))
+        free_mask = ~used_mask & ((1 << pool_size) - 1)
+
+        # Serialize candidate selection per subnet (see _subnet_lock above):
+        # same-subnet threads advance the shared cursor one at a time instead
+        # of all probing the same IP; other subnets proceed in parallel.
+        with _subnet_lock(subnet_key):
+            cursor = SUBNET_CURSOR.get(subnet_key, first_host)
+            if not (first_host <= cursor < last_host):
+                cursor = first_host
+            start_off = cursor - first_host
+
+            # Every refused txn below is a wasted Raft round-trip, so when the
+            # cached used-set turns out stale we fold what we learn back in and,
+            # after a few misses, resync the whole set from etcd in one bulk scan
+            # rather than probing candidate after candidate.
+            cas_misses = 0
+
+            while free_mask:
+                # Lowest free bit at/after the cursor, wrapping to the pool start.
+                shifted = free_mask >> start_off
+                if shifted:
+                    off = start_off + (shifted & -shifted).bit_length() - 1
+                else:
+                    off = (free_mask & -free_mask).bit_length() - 1
+
+                n = first_host + off
+                bare = int_to_ip(n)
+
+                # Canonical key (NEW)
+                key_bare = f"/vlan/ip/{bare}"
+
+                # Old key style (if your initializer still writes it): /vlan/ip/<ip>/<prefix>
+                key_old_cidr = f"/vlan/ip/{bare}{cidr_suffix}"
+
+                payload = {
+                    "status": "allocated",
+                    "source": "api-allocate",
+                    "region": REGION,
+                    "subnet": str(ip_net),
+                    "allocated_at": datetime.utcnow().isoformat() + "Z",
+                    "linode_id": None,
+                    "notes": "",
+                }
 
+                try:
+                    # Transaction: allocate ONLY if neither bare-key nor old-cidr-key exists
+                    ok, _ = etcd.transaction(
+                        compare=[
+                            etcd.transactions.version(key_bare) == 0,
+                            etcd.transactions.version(key_old_cidr) == 0,
+                        ],
+                        success=[
+                            etcd.transactions.put(key_bare, _encode_payload(payload)),
+                        ],
+                        failure=[],
+                    )
+
+                    if ok:
+                        allocated_cidr = f"{bare}{cidr_suffix}"
+                        ETCD_USED_CACHE["ips"].add(bare)
+                        SUBNET_CURSOR[subnet_key] = n + 1
+                        log(f"[SUCCESS] Allocated IP: {allocated_cidr} (stored as bare key {key_bare})")
+                        return jsonify({
+                            "allocated_ip": allocated_cidr,   # backward compatible
+                            "ip": bare,                       # useful for UI/logic
+                            "cidr": cidr_suffix
+                        }), 200
+
+                    # Txn refused: the key exists even though our cached view said
+                    # it was free. Clear the bit, and after repeated misses rebuild
+                    # the bitmap from a fresh bulk scan.
+                    ETCD_USED_CACHE["ips"].add(bare)
+                    free_mask &= ~(1 << off)
+                    cas_misses += 1
+                    if cas_misses >= 3:
+                        log("[WARN] Repeated CAS misses on stale cache; resyncing used-IP set from etcd")
+                        ETCD_USED_CACHE["timestamp"] = None
+                        free_mask &= ~build_mask(get_etcd_used_ips(etcd))
+                        cas_misses = 0
+
+                except Exception as e:
+                    log(f"[ERROR] etcd transaction failed for {bare}: {str(e)}")
+                    return jsonify({"error": f"Failed to allocate IP: {str(e)}"}), 500
+
+        msg = f"No IPs available in subnet {subnet}. Pool size={pool_size}"
+        log(f"[ERROR] {msg}")
+        return jsonify({"error": msg}), 400
+
+    except Exception as e:
+        log(f"[ERROR] Unexpected error in /allocate endpoint: {str(e)}")
+        return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
+
+
+# --------------------------------------------------------------------------------------
+# POST /allocate_batch
+# --------------------
+# Input:
+#   {"subnet": "192.168.0.0/24", "count": 8}
+#
+# Output (success):
+#   {"allocated_ips": ["192.168.0.9/24", ...], "ips": ["192.168.0.9", ...], "cidr": "/24"}
+#
+# Bulk variant of /allocate for bring-up of many nodes at once: instead of N
+# HTTP round-trips each paying its own etcd Raft commit, all N IPs are claimed
+# with ONE transaction (N create-guards + N puts commit as a single Raft
+# entry). If another allocator races us, the whole txn fails and we rebuild
+# the candidate list from a fresh etcd scan, bounded to a few attempts.
+#
+# count is capped at 64: each IP contributes two version guards (both key
+# styles), and etcd rejects any txn list over --max-txn-ops (default 128).
+# 64 keeps the batch atomic instead of silently splitting it into chunks
+# that could half-succeed. Callers needing more issue multiple requests.
+# --------------------------------------------------------------------------------------
+
+@app.route("/allocate_batch", methods=["POST"])
+def allocate_batch():
+    try:
+        data = request.get_json(silent=True) or {}
+        subnet = data.get("subnet")
+        if not subnet:
+            log("[ERROR] Subnet not provided")
+            return jsonify({"error": "Subnet not provided"}), 400
+
+        try:
+            count = int(data.get("count", 1))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Invalid count"}), 400
+        if count < 1 or count > _SYNC_TXN_CHUNK:
+            return jsonify({"error": f"count must be between 1 and {_SYNC_TXN_CHUNK}"}), 400
+
+        if not REGION:
+            log("[ERROR] REGION not provided")
+            return jsonify({"error": "Region not provided"}), 400
+
+        try:
+            ip_net = parse_subnet(subnet)
+            cidr_suffix = f"/{ip_net.prefixlen}"
+        except ValueError:
+            log("[ERROR] Invalid subnet format")
+            return jsonify({"error": "Invalid subnet format"}), 400
+
+        etcd = get_etcd_connection()
+        linode_assigned_bare = set(fetch_assigned_ips() or [])
         res = reserved_set(ip_net)
 
-        # Iterate usable hosts only (safe)
-        for host_ip in ip_net.hosts():
-            bare = str(host_ip)
+        first_host = int(ip_net.network_address) + 1
+        last_host = int(ip_net.broadcast_address)      # exclusive
 
-            if bare in res:
-                log(f"[INFO] Skipping Reserved IP: {bare}")
-                continue
+        for attempt in range(3):
+            if attempt > 0:
+                # Another writer raced the batch; rescan etcd for ground truth.
+                ETCD_USED_CACHE["timestamp"] = None
 
-            if bare in used_bare:
-                continue
+            skip_ints = set()
+            for s in chain(get_etcd_used_ips(etcd), linode_assigned_bare, res):
+                try:
+                    skip_ints.add(ip_to_int(s))
+                except (OSError, ValueError):
+                    continue
 
-            # Canonical key (NEW)
-            key_bare = f"/vlan/ip/{bare}"
+            candidates = []
+            for n in range(first_host, last_host):
+                if n in skip_ints:
+                    continue
+                candidates.append(int_to_ip(n))
+                if len(candidates) == count:
+                    break
 
-            # Old key style (if your initializer still writes it): /vlan/ip/<ip>/<prefix>
-            key_old_cidr = f"/vlan/ip/{bare}{cidr_suffix}"
+            if len(candidates) < count:
+                msg = f"Only {len(candidates)} IPs available in subnet {subnet}, requested {count}"
+                log(f"[ERROR] {msg}")
+                return jsonify({"error": msg}), 400
 
             payload = {
                 "status": "allocated",
-                "source": "api-allocate",
+                "source": "api-allocate-batch",
                 "region": REGION,
                 "subnet": str(ip_net),
                 "allocated_at": datetime.utcnow().isoformat() + "Z",
@@ -646,38 +1417,29 @@ def allocate_ip():
                 "notes": "",
             }
 
-            try:
-                # Transaction: allocate ONLY if neither bare-key nor old-cidr-key exists
-                ok, _ = etcd.transaction(
-                    compare=[
-                        etcd.transactions.version(key_bare) == 0,
-                        etcd.transactions.version(key_old_cidr) == 0,
-                    ],
-                    success=[
-                        etcd.transactions.put(key_bare, yaml.safe_dump(payload)),
-                    ],
-                    failure=[],
-                )
+            compare = []
+            success = []
+            for bare in candidates:
+                compare.append(etcd.transactions.version(f"/vlan/ip/{bare}") == 0)
+                compare.append(etcd.transactions.version(f"/vlan/ip/{bare}{cidr_suffix}") == 0)
+                success.append(etcd.transactions.put(f"/vlan/ip/{bare}", _encode_payload(payload)))
 
-                if ok:
-                    allocated_cidr = f"{bare}{cidr_suffix}"
-                    log(f"[SUCCESS] Allocated IP: {allocated_cidr} (stored as bare key {key_bare})")
-                    return jsonify({
-                        "allocated_ip": allocated_cidr,   # backward compatible
-                        "ip": bare,                       # useful for UI/logic
-                        "cidr": cidr_suffix
-                    }), 200
+            ok, _ = etcd.transaction(compare=compare, success=success, failure=[])
+            if ok:
+                ETCD_USED_CACHE["ips"].update(candidates)
+                log(f"[SUCCESS] Batch-allocated {count} IP(s) in one txn: {candidates}")
+                return jsonify({
+                    "allocated_ips": [f"{b}{cidr_suffix}" for b in candidates],
+                    "ips": candidates,
+                    "cidr": cidr_suffix,
+                }), 200
 
-            except Exception as e:
-                log(f"[ERROR] etcd transaction failed for {bare}: {str(e)}")
-                return jsonify({"error": f"Failed to allocate IP: {str(e)}"}), 500
+            log(f"[WARN] Batch allocation txn lost a race (attempt {attempt + 1}/3); retrying")
 
-        msg = f"No IPs available in subnet {subnet}. Used={len(used_bare)}, Reserved={len(res)}"
-        log(f"[ERROR] {msg}")
-        return jsonify({"error": msg}), 400
+        return jsonify({"error": "Batch allocation kept losing races; try again"}), 409
 
     except Exception as e:
-        log(f"[ERROR] Unexpected error in /allocate endpoint: {str(e)}")
+        log(f"[ERROR] Unexpected error in /allocate_batch endpoint: {str(e)}")
         return jsonify({"error": f"Unexpected error: {str(e)}"}), 500
 
 
@@ -697,21 +1459,6 @@ def allocate_ip():
 # --------------------------------------------------------------------------------------
 
 @app.route("/release", methods=["POST"])
-# --------------------------------------------------------------------------------------
-# POST /release
-# -------------
-# Input:
-#   {"ip_address": "192.168.0.9"}  OR {"ip_address": "192.168.0.9/24"}
-#
-# Behavior:
-# - Normalizes the IP to bare form
-# - Prevents releasing reserved IPs
-# - Deletes both possible key styles:
-#      /vlan/ip/<bare>
-#      /vlan/ip/<bare>/<cidr>
-# - Returns 200 if any deletion happened, else 404
-# --------------------------------------------------------------------------------------
-
 def release_ip():
     try:
         data = request.get_json(silent=True) or {}
@@ -719,13 +1466,12 @@ def release_ip():
         if not ip_address:
             return jsonify({"error": "IP address not provided"}), 400
 
-        REGION = os.getenv("REGION")
         SUBNET = os.getenv("SUBNET")
         if not REGION or not SUBNET:
             return jsonify({"error": "Missing REGION or SUBNET env variable"}), 500
 
         try:
-            ip_net = ipaddress.ip_network(SUBNET, strict=False)
+            ip_net = parse_subnet(SUBNET)
             cidr_suffix = f"/{ip_net.prefixlen}"
         except Exception:
             return jsonify({"error": "Invalid SUBNET env variable"}), 500
@@ -742,17 +1488,46 @@ def release_ip():
         key_bare = f"/vlan/ip/{bare}"
         key_old_cidr = f"/vlan/ip/{bare}{cidr_suffix}"
 
+        # Both key styles are removed in one transaction so a release costs a
+        # single etcd round trip (one Raft commit) instead of two serial
+        # deletes. The response still reflects whether anything was deleted,
+        # so the 200-vs-404 contract the shell scripts rely on is unchanged.
         deleted_any = False
         try:
-            if etcd.delete(key_bare):
-                deleted_any = True
-            if etcd.delete(key_old_cidr):
-                deleted_any = True
+            _, responses = etcd.transaction(
+                compare=[],
+                success=[
+                    etcd.transactions.delete(key_bare),
+                    etcd.transactions.delete(key_old_cidr),
+                ],
+                failure=[],
+            )
+            for r in responses:
+                if getattr(getattr(r, "response_delete_range", None), "deleted", 0):
+                    deleted_any = True
         except Exception as e:
             log(f"[ERROR] Release failed: {str(e)}")
             return jsonify({"error": f"Release failed: {str(e)}"}), 500
 
         if deleted_any:
+            ETCD_USED_CACHE["ips"].discard(bare)
+            # Patch the Linode-side cache too so a stale entry cannot shadow
+            # the freed IP until the next background fleet scan.
+            if VLAN_IP_CACHE["ips"] and bare in VLAN_IP_CACHE["ips"]:
+                VLAN_IP_CACHE["ips"].remove(bare)
+            # Pull the allocation cursor back to the freed address so the next
+            # /allocate reuses it instead of marching on past it — keeps the
+            # pool compact and stops the cursor outrunning a churning fleet.
+            subnet_key = str(ip_net)
+            try:
+                released_int = ip_to_int(bare)
+            except (OSError, ValueError):
+                released_int = None
+            if released_int is not None:
+                with _subnet_lock(subnet_key):
+                    cur = SUBNET_CURSOR.get(subnet_key)
+                    if cur is not None and released_int < cur:
+                        SUBNET_CURSOR[subnet_key] = released_int
             log(f"[INFO] Released IP from etcd: {bare} (deleted bare and/or old cidr key)")
             return jsonify({"status": "IP released", "ip": bare}), 200
 
@@ -777,6 +1552,15 @@ def release_ip():
 # 4) local system health (CPU/mem)
 # --------------------------------------------------------------------------------------
 
+# Whole-result cache for /health so simultaneous kubelet probes against the
+# same pod collapse into one real check per second.
+_HEALTH_CACHE = {
+    "result": None,
+    "timestamp": None,
+    "ttl_seconds": float(os.getenv("HEALTH_CACHE_TTL_SECONDS", 1)),
+}
+
+
 @app.route("/health", methods=["GET"])
 # --------------------------------------------------------------------------------------
 # GET /health
@@ -792,43 +1576,78 @@ def release_ip():
 # --------------------------------------------------------------------------------------
 
 def health_check():
+    # With three replicas each probed by kubelet liveness + readiness, /health
+    # fires several times a second across the deployment. A short result cache
+    # absorbs those storms; 1s is far below the probe periods, so a real
+    # failure is still seen promptly.
+    now = time.time()
+    if (
+        _HEALTH_CACHE["result"] is not None
+        and now - _HEALTH_CACHE["timestamp"] < _HEALTH_CACHE["ttl_seconds"]
+    ):
+        body, code = _HEALTH_CACHE["result"]
+        return jsonify(body), code
+
+    body, code = _run_health_checks()
+    _HEALTH_CACHE["result"] = (body, code)
+    _HEALTH_CACHE["timestamp"] = time.time()
+    return jsonify(body), code
+
+
+def _run_health_checks():
     try:
         linode_token = fetch_linode_token()
         if not linode_token:
             log("[ERROR] Health check: Failed to validate Linode CLI configuration")
-            return jsonify({"status": "unhealthy", "error": "Invalid Linode CLI configuration"}), 500
+            return {"status": "unhealthy", "error": "Invalid Linode CLI configuration"}, 500
 
         headers = {"Authorization": f"Bearer {linode_token}"}
-        REGION = os.getenv("REGION")
         if not REGION:
             log("[ERROR] Health check: REGION environment variable not set")
-            return jsonify({"status": "unhealthy", "error": "REGION environment variable not set"}), 500
+            return {"status": "unhealthy", "error": "REGION environment variable not set"}, 500
+
+        if not region_is_valid(headers):
+            log(f"[ERROR] Health check: REGION '{REGION}' is not a valid Linode region")
+            return {"status": "unhealthy", "error": f"Unknown Linode region: {REGION}"}, 500
+
+        # The four independent probes run concurrently, so wall time is the
+        # slowest probe rather than the sum — one sluggish Linode endpoint can
+        # no longer push /health past the kubelet probe timeout on its own.
+        # The API probes are additionally TTL-cached (with stale-on-error), so
+        # most checks never leave the process.
+        def probe_etcd():
+            get_etcd_connection().status()
+            return True
 
         start_time = time.time()
-        response = requests.get("https://api.linode.com/v4/account", headers=headers, timeout=8)
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            f_account = pool.submit(
+                cached_api_get, "https://api.linode.com/v4/account", headers, ttl_seconds=300)
+            f_networking = pool.submit(
+                cached_api_get, "https://api.linode.com/v4/networking/ips", headers, ttl_seconds=300)
+            f_etcd = pool.submit(probe_etcd)
+            f_system = pool.submit(system_health_check)
+
+            account = f_account.result()
+            networking = f_networking.result()
+            f_etcd.result()                # raises if etcd is unreachable
+            system_ok = f_system.result()
         latency_ms = (time.time() - start_time) * 1000
 
-        if response.status_code == 401:
-            return jsonify({"status": "unhealthy", "error": "Unauthorized access"}), 500
-        if response.status_code != 200:
-            return jsonify({"status": "unhealthy", "error": "Failed to connect to Linode API"}), 500
-
-        response = requests.get("https://api.linode.com/v4/networking/ips", headers=headers, timeout=8)
-        if response.status_code != 200:
-            return jsonify({"status": "unhealthy", "error": "Failed to access networking API"}), 500
+        if account is None:
+            return {"status": "unhealthy", "error": "Failed to connect to Linode API"}, 500
 
-        # etcd
-        etcd = get_etcd_connection()
-        etcd.status()
+        if networking is None:
+            return {"status": "unhealthy", "error": "Failed to access networking API"}, 500
 
-        if not system_health_check():
-            return jsonify({"status": "unhealthy", "error": "System health checks failed"}), 500
+        if not system_ok:
+            return {"status": "unhealthy", "error": "System health checks failed"}, 500
 
-        return jsonify({"status": "healthy", "latency_ms": latency_ms}), 200
+        return {"status": "healthy", "latency_ms": latency_ms}, 200
 
     except Exception as e:
         log(f"[ERROR] Health check: {str(e)}")
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        return {"status": "unhealthy", "error": str(e)}, 500
 
 
 # --------------------------------------------------------------------------------------
@@ -842,29 +1661,46 @@ def health_check():
 # --------------------------------------------------------------------------------------
 
 @app.get("/api/v1/vlan-ips")
-# --------------------------------------------------------------------------------------
-# GET /api/v1/vlan-ips
-# --------------------
-# Returns the set of IPs currently recorded in etcd under ETCD_PREFIX (default /vlan/ip/).
-# This endpoint is typically consumed by your future "VLAN IP inventory dashboard".
-#
-# Note:
-# - We normalize keys to bare IP so historical key formats do not create duplicates in UI.
-# --------------------------------------------------------------------------------------
-
 def list_ips():
-    prefix = os.getenv("ETCD_PREFIX", "/vlan/ip/")
-    ips = []
+    prefix = ETCD_PREFIX
+    batch = int(os.getenv("ETCD_RANGE_BATCH", 2000))
+    seen = set()
     etcd = get_etcd()
 
-    for _value, meta in etcd.get_prefix(prefix):
-        key = meta.key.decode()
-        raw = key.split(prefix, 1)[1]
+    # ?count_only=1: the dashboard's "how many IPs are allocated" tile needs a
+    # number, not the list. etcd can answer that server-side without
+    # materializing a single key or value. (The count is of raw keys, so an IP
+    # recorded under both the bare and legacy <ip>/<cidr> style counts twice.)
+    if request.args.get("count_only") in ("1", "true"):
+        start = to_bytes(prefix)
+        req = etcdrpc.RangeRequest(
+            key=start, range_end=prefix_range_end(start), count_only=True)
+        resp = etcd.kvstub.Range(
+            req, etcd.timeout,
+            credentials=etcd.call_credentials,
+            metadata=etcd.metadata,
+        )
+        return jsonify({"count": resp.count})
+
+    # Bounded, keys-only pages (see _scan_prefix_keys); the prefix is stripped
+    # by length-based slicing computed once outside the loop — no per-key
+    # substring search, and the values never leave etcd. normalize_ip stays:
+    # legacy <ip>/<cidr> keys must still collapse to the bare IP.
+    plen = len(prefix)
+    for key in _scan_prefix_keys(etcd, prefix, batch):
+        raw = key[plen:].decode("utf-8")
         bare = normalize_ip(raw)
         if bare:
-            ips.append(bare)
-
-    ips = sorted(set(ips), key=lambda s: [int(x) for x in s.split(".")])
+            seen.add(bare)
+
+    # Dedup happened while streaming (legacy duplicate key styles land in the
+    # same set entry), so the only remaining pass is the sort. inet_aton packs
+    # each IP to 4 big-endian bytes, whose lexicographic order IS numeric IP
+    # order — one C call per element instead of a split, four int() parses and
+    # a list allocation.
+    ips = sorted(seen, key=inet_aton)
+    if orjson is not None:
+        return Response(orjson.dumps({"ips": ips}), mimetype="application/json")
     return jsonify({"ips": ips})
 
 
@@ -879,33 +1715,83 @@ def list_ips():
 #   clash. (You will still want server-side rate limiting/capping to avoid spam.)
 # --------------------------------------------------------------------------------------
 
-@app.post("/api/v1/refresh")
-# --------------------------------------------------------------------------------------
-# POST /api/v1/refresh
-# --------------------
-# Creates a new run of the VLAN IP initializer job inside Kubernetes to re-sync etcd
-# with current Linode allocations.
-#
-# Safety:
-# - We generate a unique job name using UUID suffix so multiple refresh requests do not
-#   clash. (You will still want server-side rate limiting/capping to avoid spam.)
-# --------------------------------------------------------------------------------------
+# Job creation runs off the request thread (see refresh() below). Two workers
+# are plenty: refreshes are rare and the detail endpoint does the polling.
+_REFRESH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="refresh-job")
+
+# Coalescing cell: dashboard refresh-button mashing should converge on one
+# running job, not stack a Job object per click.
+_LAST_REFRESH = {"name": None, "ts": 0.0}
+_LAST_REFRESH_LOCK = threading.Lock()
+_REFRESH_COALESCE_SECONDS = int(os.getenv("REFRESH_COALESCE_SECONDS", 60))
+
+# The initializer Job manifest is static; parse it once and stamp per-run
+# metadata onto a deepcopy. Loaded lazily (the manifest only exists inside
+# the pod) with the libyaml C loader when the image provides it — PyYAML's
+# pure-Python parser costs milliseconds per document.
+_JOB_TEMPLATE = None
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
 
-def refresh():
-    ns = os.getenv("NAMESPACE", "kube-system")
-    manifest_path = "/manifests/05-vlan-ip-initializer-job.yaml"
 
-    with open(manifest_path, "r") as f:
-        job_def = yaml.safe_load(f)
+def _create_refresh_job(ns, run_name, job_def):
+    try:
+        batch, _ = k8s_api()
+        batch.create_namespaced_job(namespace=ns, body=job_def)
+        log(f"[INFO] Created refresh job {run_name} in namespace {ns}")
+    except Exception as e:
+        log(f"[ERROR] Failed to create refresh job {run_name}: {str(e)}")
 
-    base_name = job_def["metadata"]["name"]
-    run_name = f"{base_name}-{uuid.uuid4().hex[:6]}"
-    job_def["metadata"]["name"] = run_name
-    job_def["metadata"]["namespace"] = ns
 
-    batch, _ = k8s_api()
-    batch.create_namespaced_job(namespace=ns, body=job_def)
-    return jsonify({"jobName": run_name})
+@app.post("/api/v1/refresh")
+def refresh():
+    global _JOB_TEMPLATE
+    ns = NAMESPACE
+
+    # Coalesce: if a refresh job was requested recently and is still running,
+    # hand back its name instead of creating a duplicate — the re-sync about
+    # to finish already reflects the state the caller wants refreshed.
+    with _LAST_REFRESH_LOCK:
+        prev = _LAST_REFRESH["name"]
+        if prev and time.time() - _LAST_REFRESH["ts"] < _REFRESH_COALESCE_SECONDS:
+            try:
+                batch, _ = k8s_api()
+                st = batch.read_namespaced_job_status(prev, ns).status
+                if st.active and not st.completion_time:
+                    log(f"[INFO] Coalescing refresh request onto running job {prev}")
+                    return jsonify({"jobName": prev, "coalesced": True}), 202
+            except Exception:
+                # Creation is async, so a very recent submission may not be
+                # visible yet; treat it as in flight rather than stacking
+                # another job. Older failures fall through to a fresh run.
+                if time.time() - _LAST_REFRESH["ts"] < 10:
+                    return jsonify({"jobName": prev, "coalesced": True}), 202
+
+        if _JOB_TEMPLATE is None:
+            manifest_path = "/manifests/05-vlan-ip-initializer-job.yaml"
+            with open(manifest_path, "r") as f:
+                _JOB_TEMPLATE = yaml.load(f, Loader=_YAML_LOADER)
+        job_def = copy.deepcopy(_JOB_TEMPLATE)
+
+        base_name = job_def["metadata"]["name"]
+        run_name = f"{base_name}-{uuid.uuid4().hex[:6]}"
+        job_def["metadata"]["name"] = run_name
+        job_def["metadata"]["namespace"] = ns
+
+        # The K8s API call to create the Job can take hundreds of ms; hand it
+        # to the background executor and answer immediately. The job name is
+        # chosen up front, so the existing /api/v1/refresh/<job>/detail
+        # polling endpoint works unchanged (it returns a Pending 404 while
+        # creation is still in flight or if it failed — failures are logged).
+        _REFRESH_EXECUTOR.submit(_create_refresh_job, ns, run_name, job_def)
+        _LAST_REFRESH["name"] = run_name
+        _LAST_REFRESH["ts"] = time.time()
+
+    # The job re-syncs etcd from Linode; drop our cached views so the next
+    # /allocate sees its results instead of waiting out the TTLs.
+    VLAN_IP_CACHE["timestamp"] = None
+    ETCD_USED_CACHE["timestamp"] = None
+
+    return jsonify({"jobName": run_name}), 202
 
 
 # --------------------------------------------------------------------------------------
@@ -919,22 +1805,36 @@ def refresh():
 # This is meant to power the UI "Refresh status" view.
 # --------------------------------------------------------------------------------------
 
-@app.get("/api/v1/refresh/<job_name>/detail")
-# --------------------------------------------------------------------------------------
-# GET /api/v1/refresh/<job_name>/detail
-# ------------------------------------
-# Provides:
-# - Job status (Running/Succeeded/Failed)
-# - start/completion timestamps (if available)
-# - best-effort pod logs (tail)
-#
-# This is meant to power the UI "Refresh status" view.
-# --------------------------------------------------------------------------------------
+# Per-job short cache for the detail view: the UI polls every second or two,
+# and each miss costs a job read, a pod list and a log fetch from the kubelet.
+_JOB_DETAIL_CACHE = {}
+_JOB_DETAIL_TTL_SECONDS = float(os.getenv("JOB_DETAIL_TTL_SECONDS", 5))
+
 
+@app.get("/api/v1/refresh/<job_name>/detail")
 def refresh_detail(job_name):
-    ns = os.getenv("NAMESPACE", "kube-system")
+    cached = _JOB_DETAIL_CACHE.get(job_name)
+    if cached is not None and time.time() - cached[1] < _JOB_DETAIL_TTL_SECONDS:
+        return jsonify(cached[0])
+
+    ns = NAMESPACE
     batch, core = k8s_api()
-    job = batch.read_namespaced_job_status(job_name, ns)
+    try:
+        job = batch.read_namespaced_job_status(job_name, ns)
+    except ApiException as e:
+        if e.status == 404:
+            # Job creation is async (see /api/v1/refresh), so a poll can
+            # arrive before the apiserver knows the name we handed out.
+            # Report Pending instead of a 500; deliberately uncached so the
+            # first real status is picked up as soon as it exists.
+            return jsonify({
+                "status": "Pending",
+                "startedAt": None,
+                "completedAt": None,
+                "podName": None,
+                "logs": "",
+            }), 404
+        raise
 
     status = "Running"
     started_at = job.status.start_time.isoformat() if job.status.start_time else None
@@ -950,11 +1850,16 @@ def refresh_detail(job_name):
             if not completed_at and c.last_transition_time:
                 completed_at = c.last_transition_time.isoformat()
 
-    # best-effort pod logs
+    # best-effort pod logs. The job controller labels its pods with
+    # job-name=<job>, so the apiserver can hand us exactly the pod we want —
+    # no full-namespace pod list (kube-system easily holds hundreds of pods)
+    # and no substring matching here. resource_version="0" lets the apiserver
+    # answer from its watch cache instead of a quorum etcd read.
     pod_name, logs = None, ""
-    pods = core.list_namespaced_pod(ns)
+    pods = core.list_namespaced_pod(
+        ns, label_selector=f"job-name={job_name}", limit=1, resource_version="0")
     for p in pods.items:
-        if p.metadata and p.metadata.name and job_name in p.metadata.name:
+        if p.metadata and p.metadata.name:
             pod_name = p.metadata.name
             try:
                 logs = core.read_namespaced_pod_log(name=pod_name, namespace=ns, tail_lines=500)
@@ -962,17 +1867,31 @@ def refresh_detail(job_name):
                 pass
             break
 
-    return jsonify({
+    payload = {
         "status": status,
         "startedAt": started_at,
         "completedAt": completed_at,
         "podName": pod_name,
         "logs": logs,
-    })
+    }
+    _JOB_DETAIL_CACHE[job_name] = (payload, time.time())
+    # Terminal states never change; drop stale siblings so the cache does not
+    # accumulate an entry per historical job run.
+    if len(_JOB_DETAIL_CACHE) > 32:
+        cutoff = time.time() - 300
+        for k in [k for k, v in _JOB_DETAIL_CACHE.items() if v[1] < cutoff]:
+            _JOB_DETAIL_CACHE.pop(k, None)
+    return jsonify(payload)
 
 
 if __name__ == "__main__":
+    # Dev-only entrypoint. In the cluster this app runs under gunicorn with
+    # gthread workers (see gunicorn_conf.py and the controller deployment);
+    # the Werkzeug server below is for local debugging only.
     validate_environment()
+    start_background_workers()
     #print("DEBUG VLAN IPs from Linode:", fetch_assigned_ips())
     #app.run(host="0.0.0.0", port=8080, debug=True)
-    app.run(host="0.0.0.0", port=8080, debug=False)
+    # Handlers spend most of their time blocked on Linode / etcd I/O, so make
+    # sure the built-in server multiplexes requests across threads.
+    app.run(host="0.0.0.0", port=8080, debug=False, threaded=True)
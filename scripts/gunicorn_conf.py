@@ -0,0 +1,57 @@
+# gunicorn_conf.py
+#
+# Gunicorn configuration for the VLAN IP Controller REST API (06-rest-api.py).
+#
+# Why gunicorn instead of app.run()
+# ---------------------------------
+# The built-in Werkzeug server is a development tool: one process, no worker
+# recycling, no keep-alive tuning. Gunicorn gives us a production master/worker
+# model while keeping the Flask app untouched.
+#
+# Worker model
+# ------------
+# - "gthread" workers: the handlers spend nearly all their time blocked on
+#   Linode API / etcd I/O, so a small number of processes with a thread pool
+#   per process gives good concurrency without async rewrites.
+# - gevent workers were deliberately NOT used: etcd3 rides on gRPC, whose C
+#   core does not tolerate gevent monkey-patching.
+# - Default is a single worker so the in-process caches (token, etcd used-set,
+#   subnet cursors) and the rotating log file stay consistent. Scale with
+#   GUNICORN_WORKERS once behind a shared cache.
+#
+# © Linode-LKE-Private-Network | Developed by Sandip Gangdhar | 2025
+
+import os
+
+bind = "0.0.0.0:8080"
+workers = int(os.getenv("GUNICORN_WORKERS", 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+keepalive = 5
+preload_app = True
+chdir = "/tmp"
+
+# Recycle workers occasionally to shed any slow accumulation (ETag cache,
+# gRPC channel state); the jitter staggers restarts so replicas never lose
+# all workers at once.
+max_requests = 100_000
+max_requests_jitter = 100
+
+# Log to stdout/stderr so kubectl logs keeps working.
+accesslog = "-"
+errorlog = "-"
+
+
+def on_starting(server):
+    # Fail fast before any worker forks if REGION/ETCD_ENDPOINTS are missing,
+    # matching the validate_environment() guard of the standalone entrypoint.
+    import rest_api
+    rest_api.validate_environment()
+
+
+def post_fork(server, worker):
+    # The preload_app import above happens in the master, and daemon threads
+    # do not survive the fork — so each worker starts its own background
+    # workers (Linode sync, etcd watch, optional compaction) here.
+    import rest_api
+    rest_api.start_background_workers()
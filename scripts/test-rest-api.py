@@ -0,0 +1,234 @@
+# ======================================================================================
+# test-rest-api.py
+#
+# Smoke test for the VLAN IP Controller REST API (06-rest-api.py).
+#
+# Exercises the public endpoints end-to-end against a running instance:
+#   1) GET  /health           -> service + dependency health
+#   2) POST /allocate         -> grab one IP from TEST_SUBNET
+#   3) POST /release          -> give the allocated IP back
+#   4) GET  /api/v1/vlan-ips  -> list the keys recorded in etcd
+#
+# Configuration (environment):
+#   TARGET_URL   Base URL of the API       (default: http://localhost:8080)
+#   TEST_SUBNET  Subnet to allocate from   (default: 192.168.0.0/24)
+#
+# All calls share one requests.Session with a small mounted connection pool, so
+# the TCP handshake is paid once and calls 2-4 reuse the keep-alive socket --
+# the same pooling the controller itself uses for the Linode API.
+#
+# Exit status: 0 if every phase passed, 1 otherwise (suitable for CI).
+#
+# 🖋️ Author:
+# - Sandip Gangdhar
+# - GitHub: https://github.com/sandipgangdhar
+#
+# © Linode-LKE-Private-Network | Developed by Sandip Gangdhar | 2025
+# ======================================================================================
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Same optional dependency the controller uses: orjson's C parser when it is
+# installed, stdlib json otherwise. Decoding response.content directly skips
+# the encoding-sniffing pass inside response.json().
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    import json
+    _loads = json.loads
+
+    def _dumps(obj):
+        return json.dumps(obj).encode("utf-8")
+
+TARGET_URL = os.getenv("TARGET_URL", "http://localhost:8080").rstrip("/")
+TEST_SUBNET = os.getenv("TEST_SUBNET", "192.168.0.0/24")
+
+# Endpoint URLs built once at import instead of f-string concatenation at
+# every call site; matters only when the script is looped, but costs nothing.
+HEALTH_URL = TARGET_URL + "/health"
+ALLOCATE_URL = TARGET_URL + "/allocate"
+ALLOCATE_BATCH_URL = TARGET_URL + "/allocate_batch"
+RELEASE_URL = TARGET_URL + "/release"
+LIST_IPS_URL = TARGET_URL + "/api/v1/vlan-ips"
+
+
+# Output is buffered and written once at the end (and on any exit path via
+# the finally in main): one write() syscall instead of one per message, and
+# the concurrent phases can no longer interleave their lines mid-run.
+_OUT_LINES = []
+_OUT_LOCK = threading.Lock()
+
+
+def say(message):
+    with _OUT_LOCK:
+        _OUT_LINES.append(message)
+
+
+def _flush_output():
+    with _OUT_LOCK:
+        if _OUT_LINES:
+            sys.stdout.write("\n".join(_OUT_LINES) + "\n")
+            sys.stdout.flush()
+            _OUT_LINES.clear()
+
+
+def _post_json(session, url, payload, timeout=35):
+    # data=_dumps(...) hands requests pre-encoded bytes, so the body bypasses
+    # the stdlib json.dumps the json= kwarg would run internally.
+    return session.post(url, data=_dumps(payload),
+                        headers={"Content-Type": "application/json"}, timeout=timeout)
+
+
+# ETag seen on the last /health response, if the server sent one. Later calls
+# in the same run revalidate with If-None-Match, so a repeated health probe
+# that has not changed costs a 304 with no body instead of a full response.
+_HEALTH_ETAG = {"value": None}
+
+
+def test_health(session):
+    say("[TEST] GET /health")
+    headers = {}
+    if _HEALTH_ETAG["value"]:
+        headers["If-None-Match"] = _HEALTH_ETAG["value"]
+    response = session.get(HEALTH_URL, headers=headers, timeout=35)
+    if response.status_code not in (200, 304):
+        say(f"[FAIL] /health returned {response.status_code}: {response.text[:200]}")
+        return False
+    if response.headers.get("ETag"):
+        _HEALTH_ETAG["value"] = response.headers["ETag"]
+    say("[OK] /health OK" + (" (304 not modified)" if response.status_code == 304 else ""))
+    return True
+
+
+def test_allocate_release(session):
+    say(f"[TEST] POST /allocate (subnet={TEST_SUBNET})")
+    response = _post_json(session, ALLOCATE_URL, {"subnet": TEST_SUBNET})
+    if not response.ok:
+        say(f"[FAIL] /allocate returned {response.status_code}: {response.text[:200]}")
+        return False
+
+    allocated_ip = _loads(response.content).get("allocated_ip")
+    if not allocated_ip:
+        say(f"[FAIL] /allocate response missing 'allocated_ip': {response.text[:200]}")
+        return False
+    say(f"[OK] /allocate OK -> {allocated_ip}")
+
+    say(f"[TEST] POST /release ({allocated_ip})")
+    response = _post_json(session, RELEASE_URL, {"ip_address": allocated_ip})
+    if not response.ok:
+        say(f"[FAIL] /release returned {response.status_code}: {response.text[:200]}")
+        return False
+    say("[OK] /release OK")
+    return True
+
+
+def test_allocate_batch(session):
+    # One round trip reserves both IPs in a single etcd transaction -- the
+    # batched shape clients should prefer over N serial /allocate calls.
+    say(f"[TEST] POST /allocate_batch (subnet={TEST_SUBNET}, count=2)")
+    response = _post_json(session, ALLOCATE_BATCH_URL, {"subnet": TEST_SUBNET, "count": 2})
+    if not response.ok:
+        say(f"[FAIL] /allocate_batch returned {response.status_code}: {response.text[:200]}")
+        return False
+
+    allocated = _loads(response.content).get("allocated_ips") or []
+    if len(allocated) != 2:
+        say(f"[FAIL] /allocate_batch returned {len(allocated)} IPs, expected 2")
+        return False
+    say(f"[OK] /allocate_batch OK -> {allocated}")
+
+    ok = True
+    for ip in allocated:
+        response = _post_json(session, RELEASE_URL, {"ip_address": ip})
+        if not response.ok:
+            say(f"[FAIL] /release of batch IP {ip} returned {response.status_code}")
+            ok = False
+    if ok:
+        say("[OK] batch release OK")
+    return ok
+
+
+def test_list_ips(session):
+    say("[TEST] GET /api/v1/vlan-ips")
+    response = session.get(LIST_IPS_URL, timeout=35)
+    if not response.ok:
+        say(f"[FAIL] /api/v1/vlan-ips returned {response.status_code}: {response.text[:200]}")
+        return False
+    say(f"[OK] /api/v1/vlan-ips OK -> {len(_loads(response.content).get('ips', []))} IPs recorded")
+    return True
+
+
+def main():
+    # --repeat N loops the whole suite inside one process and one Session, so
+    # interpreter startup and the handshake are paid once and the reported
+    # latencies reflect steady-state keep-alive behavior (soak mode).
+    parser = argparse.ArgumentParser(description="Smoke test for the VLAN IP Controller API")
+    parser.add_argument("--repeat", type=int, default=1, metavar="N",
+                        help="run the test suite N times in one process (default: 1)")
+    args = parser.parse_args()
+
+    ok = True
+    durations_ms = []
+    # One Session for the whole run: the handshake happens once and every
+    # subsequent call rides the pooled keep-alive connection.
+    with requests.Session() as session:
+        session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0))
+        # Advertise keep-alive and compression on every request up front.
+        # urllib3 decompresses gzip transparently, so the JSON phases read
+        # fewer bytes off the wire without any per-call header plumbing.
+        session.headers.update({
+            "Connection": "keep-alive",
+            "Accept-Encoding": "gzip, deflate",
+            "Accept": "application/json",
+        })
+        # Warm the pool before any [TEST] phase so the TCP handshake is not
+        # billed to the first measured call. Best-effort: an unreachable API
+        # still fails loudly in the phases themselves.
+        try:
+            session.head(HEALTH_URL, timeout=1)
+        except requests.RequestException:
+            pass
+
+        # /health and /api/v1/vlan-ips are independent of the allocate ->
+        # release chain, so they run on worker threads while the main thread
+        # walks the dependent pair; wall time is max(slowest phase) instead of
+        # the sum. pool_maxsize=4 above gives each in-flight call a socket.
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            for _ in range(max(1, args.repeat)):
+                started = time.perf_counter()
+                health_future = pool.submit(test_health, session)
+                list_future = pool.submit(test_list_ips, session)
+                ok &= test_allocate_release(session)
+                ok &= test_allocate_batch(session)
+                ok &= health_future.result()
+                ok &= list_future.result()
+                durations_ms.append((time.perf_counter() - started) * 1000)
+
+    if len(durations_ms) > 1:
+        say(f"[STATS] {len(durations_ms)} iterations: "
+              f"median {statistics.median(durations_ms):.1f} ms, "
+              f"min {min(durations_ms):.1f} ms, max {max(durations_ms):.1f} ms")
+
+    say("[OK] All tests passed" if ok else "[FAIL] Some tests FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    try:
+        code = main()
+    finally:
+        # Whatever happened -- clean run, failed assert, or an exception mid
+        # phase -- everything buffered so far reaches stdout before exit.
+        _flush_output()
+    sys.exit(code)